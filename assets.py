@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+
+import cv2
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, FSInputFile, InputMediaPhoto
+
+# Так Telegram отвечает на протухший или чужой file_id; остальные 400
+# («chat not found» и т. п.) к сохранённым id отношения не имеют
+_BAD_FILE_ID = ("wrong file identifier", "wrong remote file identifier", "file_reference", "file_id")
+
+
+def _bad_file_id(exc: TelegramBadRequest) -> bool:
+    message = str(exc.message).lower()
+    return any(marker in message for marker in _BAD_FILE_ID)
+
+
+class AssetRegistry:
+    """
+    Картинки-инструкции загружаются в Telegram один раз: из ответа берём
+    file_id и дальше отправляем по нему, без повторной заливки PNG.
+    file_id хранятся в JSON-файле вместе с mtime исходника — поменяли
+    картинку в assets/ → она зальётся заново. Если Telegram отверг
+    сохранённый file_id, он забывается и картинка заливается снова.
+    """
+
+    def __init__(self, path: str, recompress: bool = False):
+        self.path = path
+        self.recompress = recompress
+        self.ids: dict[str, dict] = {}
+        self.lock = asyncio.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.ids = json.load(f)
+
+    def _cached(self, asset: str) -> str | None:
+        entry = self.ids.get(asset)
+        if entry and entry.get("mtime") == os.path.getmtime(asset):
+            return entry["file_id"]
+        return None
+
+    def _upload(self, asset: str):
+        if not self.recompress:
+            return FSInputFile(asset)
+        # один раз пережимаем PNG в JPEG: Telegram всё равно хранит фото как JPEG
+        img = cv2.imread(asset)
+        _, enc = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        name = os.path.splitext(os.path.basename(asset))[0] + ".jpg"
+        return BufferedInputFile(enc.tobytes(), filename=name)
+
+    def _media(self, items: list[tuple[str, str | None]], use_cache: bool) -> list[InputMediaPhoto]:
+        return [
+            InputMediaPhoto(media=(use_cache and self._cached(asset)) or self._upload(asset), caption=caption)
+            for asset, caption in items
+        ]
+
+    async def send_media_group(self, bot, chat_id: int, items: list[tuple[str, str | None]]):
+        """Отправляет альбом из картинок assets/ (путь, подпись), по возможности — по file_id."""
+        if all(self._cached(asset) for asset, _ in items):
+            try:
+                return await bot.send_media_group(chat_id, self._media(items, use_cache=True))
+            except TelegramBadRequest as exc:
+                if not _bad_file_id(exc):
+                    raise
+                # file_id стал недействительным — забываем и заливаем заново
+                for asset, _ in items:
+                    self.ids.pop(asset, None)
+
+        # первая заливка: под замком, чтобы параллельные онбординги не залили одно и то же
+        async with self.lock:
+            use_cache = all(self._cached(asset) for asset, _ in items)
+            messages = await bot.send_media_group(chat_id, self._media(items, use_cache=use_cache))
+            if not use_cache:
+                for (asset, _), message in zip(items, messages):
+                    if message.photo:
+                        self.ids[asset] = {"file_id": message.photo[-1].file_id,
+                                           "mtime": os.path.getmtime(asset)}
+                self._save()
+        return messages
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.ids, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
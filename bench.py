@@ -0,0 +1,223 @@
+"""
+Офлайн-бенчмарк распознавания: генерирует синтетические скрины результатов
+ЕГЭ с известными баллами, прогоняет их через `ocr.extract_scores` и печатает
+время по стадиям, скрины/сек, пиковую память и precision/recall по предметам.
+Нужен только Tesseract — ни Telegram, ни Google Sheets не трогаются.
+
+    python bench.py --count 60
+    python bench.py --count 200 --workers 4 --save-corpus bench_corpus
+"""
+import argparse
+import glob
+import pathlib
+import random
+import statistics
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image, ImageDraw, ImageFont
+
+# OCR_BACKEND, OCR_ROI, OCR_MIN_CONF и др. ocr.py читает при импорте — меряем
+# ту же конфигурацию, что в проде, поэтому .env загружаем до него
+load_dotenv()
+import ocr
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ─── 1. Параметры корпуса ────────────────────────────────────
+RESOLUTIONS = [(720, 1600), (1080, 2340), (1080, 2400), (1170, 2532), (1440, 3200)]
+JPEG_QUALITIES = [95, 85, 70, 55]
+# предметы, которых нет в ALIASES: не должны попадать в результат
+DISTRACTORS = ["Обществознание", "Английский язык", "Биология", "История"]
+FONT_DIRS = [
+    "/usr/share/fonts/**/*.ttf",
+    "/Library/Fonts/*.ttf",
+    "/System/Library/Fonts/Supplemental/*.ttf",
+    "C:/Windows/Fonts/*.ttf",
+]
+# шрифты с кириллицей, которые обычно есть в системе
+CYRILLIC_FONTS = ("dejavu", "liberation", "roboto", "noto", "arial", "segoe", "times", "ptsans", "pt_sans")
+
+
+def display_names() -> dict[str, list[str]]:
+    """Код предмета → варианты подписи на скрине, прямо из ALIASES."""
+    names: dict[str, list[str]] = {}
+    for alias, code in ocr.ALIASES.items():
+        label = alias[0].upper() + alias[1:]
+        label = label.replace("кегэ", "КЕГЭ")
+        names.setdefault(code, []).append(label)
+    return names
+
+
+def find_fonts(patterns: list[str]) -> list[str]:
+    fonts = []
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True):
+            if any(key in pathlib.Path(path).name.lower() for key in CYRILLIC_FONTS):
+                fonts.append(path)
+    return sorted(set(fonts))
+
+
+# ─── 2. Генерация скринов ────────────────────────────────────
+def render_sample(rng: random.Random, fonts: list[str]) -> tuple[bytes, dict[str, int], dict]:
+    """Один синтетический скрин: (JPEG-байты, правильные баллы, параметры)."""
+    width, height = rng.choice(RESOLUTIONS)
+    quality = rng.choice(JPEG_QUALITIES)
+    font_path = rng.choice(fonts)
+    dark = rng.random() < 0.25
+    bg, fg, card = ((18, 18, 18), (235, 235, 235), (40, 40, 40)) if dark else ((244, 245, 247), (25, 25, 25), (255, 255, 255))
+
+    names = display_names()
+    codes = rng.sample(sorted(names), k=rng.randint(1, len(names)))
+    truth = {code: rng.randint(27, 100) for code in codes}
+    rows = [(rng.choice(names[code]), truth[code]) for code in codes]
+    rows += [(d, rng.randint(20, 100)) for d in rng.sample(DISTRACTORS, k=rng.randint(0, 2))]
+    rng.shuffle(rows)
+
+    unit = width / 1080
+    font = ImageFont.truetype(font_path, int(40 * unit))
+    big = ImageFont.truetype(font_path, int(64 * unit))
+    small = ImageFont.truetype(font_path, int(30 * unit))
+
+    img = Image.new("RGB", (width, height), bg)
+    draw = ImageDraw.Draw(img)
+    draw.text((int(40 * unit), int(20 * unit)), f"{rng.randint(8, 23)}:{rng.randint(0, 59):02d}", font=small, fill=fg)
+    draw.text((int(60 * unit), int(180 * unit)), "Результаты экзаменов", font=big, fill=fg)
+
+    y = int(340 * unit)
+    row_h = int(200 * unit)
+    shown = []
+    for label, score in rows:
+        if y + row_h > height - int(160 * unit):
+            break
+        shown.append(label)
+        draw.rounded_rectangle((int(40 * unit), y, width - int(40 * unit), y + row_h - int(30 * unit)),
+                               radius=int(24 * unit), fill=card)
+        draw.text((int(80 * unit), y + int(50 * unit)), label, font=font, fill=fg)
+        draw.text((width - int(200 * unit), y + int(40 * unit)), str(score), font=big, fill=fg)
+        y += row_h
+    # предметы, не поместившиеся на экран, в правильный ответ не входят
+    truth = {code: val for code, val in truth.items() if any(n in shown for n in names[code])}
+
+    arr = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+    ok, enc = cv2.imencode(".jpg", arr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    params = {"size": f"{width}x{height}", "quality": quality, "font": pathlib.Path(font_path).name, "dark": dark}
+    return enc.tobytes(), truth, params
+
+
+# ─── 3. Прогон ───────────────────────────────────────────────
+def run_one(data: bytes) -> tuple[dict[str, int], dict[str, float]]:
+    timings: dict[str, float] = {}
+    started = time.perf_counter()
+    scores = ocr.extract_scores(data, timings)
+    timings["total"] = time.perf_counter() - started
+    return scores, timings
+
+
+def peak_rss_mb() -> dict[str, float]:
+    """Пиковый RSS процесса и дочерних процессов (tesseract у pytesseract), МБ."""
+    if resource is None:
+        return {}
+    div = 1024 * 1024 if sys.platform == "darwin" else 1024  # macOS отдаёт байты, Linux — КБ
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / div,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / div,
+    }
+
+
+def score(results: list[tuple[dict[str, int], dict[str, int]]]) -> dict[str, dict[str, float]]:
+    """Precision/recall по каждому предмету: балл засчитывается, только если совпал точно."""
+    stats: dict[str, dict[str, int]] = {}
+    for predicted, truth in results:
+        for code in set(predicted) | set(truth):
+            s = stats.setdefault(code, {"tp": 0, "fp": 0, "fn": 0})
+            if code in predicted and predicted[code] == truth.get(code):
+                s["tp"] += 1
+                continue
+            if code in predicted:
+                s["fp"] += 1
+            if code in truth:
+                s["fn"] += 1
+    report = {}
+    for code, s in sorted(stats.items()):
+        report[code] = {
+            "precision": s["tp"] / (s["tp"] + s["fp"]) if s["tp"] + s["fp"] else 0.0,
+            "recall": s["tp"] / (s["tp"] + s["fn"]) if s["tp"] + s["fn"] else 0.0,
+            "support": s["tp"] + s["fn"],
+        }
+    return report
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк OCR скринов ЕГЭ")
+    parser.add_argument("--count", type=int, default=40, help="сколько скринов сгенерировать")
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--workers", type=int, default=1, help="процессов (1 — последовательно, чище тайминги)")
+    parser.add_argument("--fonts", nargs="*", default=FONT_DIRS, help="glob-шаблоны TTF-шрифтов")
+    parser.add_argument("--save-corpus", metavar="DIR", help="сохранить сгенерированные скрины")
+    parser.add_argument("--show-errors", action="store_true", help="напечатать скрины с ошибками")
+    args = parser.parse_args()
+
+    fonts = find_fonts(args.fonts)
+    if not fonts:
+        sys.exit("❌ Не найдено ни одного шрифта с кириллицей, укажите --fonts")
+
+    rng = random.Random(args.seed)
+    corpus = [render_sample(rng, fonts) for _ in range(args.count)]
+    if args.save_corpus:
+        out = pathlib.Path(args.save_corpus)
+        out.mkdir(parents=True, exist_ok=True)
+        for i, (data, truth, params) in enumerate(corpus):
+            (out / f"{i:04d}.jpg").write_bytes(data)
+
+    started = time.perf_counter()
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers, initializer=ocr.init_process) as pool:
+            outputs = list(pool.map(run_one, [data for data, _, _ in corpus]))
+    else:
+        ocr.init_process()
+        outputs = [run_one(data) for data, _, _ in corpus]
+    wall = time.perf_counter() - started
+
+    # ─── отчёт ───
+    print(f"Скринов: {len(corpus)}, шрифтов: {len(fonts)}, процессов: {args.workers}")
+    print(f"Время: {wall:.2f} с, {len(corpus) / wall:.2f} скр/с")
+    print("\nСтадия        mean, мс   p50, мс   p95, мс")
+    for stage in ("decode", "preprocess", "ocr", "total"):
+        values = [t.get(stage, 0.0) * 1000 for _, t in outputs]
+        print(f"{stage:<12} {statistics.mean(values):9.1f} {percentile(values, 0.5):9.1f} {percentile(values, 0.95):9.1f}")
+    passes = [t.get("passes", 0) for _, t in outputs]
+    print(f"Проходов OCR на скрин: {statistics.mean(passes):.2f} (только быстрый: {passes.count(1)}/{len(passes)})")
+
+    rss = peak_rss_mb()
+    if rss:
+        print(f"Пиковый RSS: процесс {rss['self']:.0f} МБ, дочерние {rss['children']:.0f} МБ")
+
+    results = [(predicted, truth) for (predicted, _), (_, truth, _) in zip(outputs, corpus)]
+    exact = sum(p == t for p, t in results)
+    print(f"\nПолностью верно: {exact}/{len(results)}")
+    print("Предмет   precision  recall  support")
+    for code, r in score(results).items():
+        print(f"{code:<9} {r['precision']:9.2f} {r['recall']:7.2f} {r['support']:8d}")
+
+    if args.show_errors:
+        for i, ((predicted, truth), (_, _, params)) in enumerate(zip(results, corpus)):
+            if predicted != truth:
+                print(f"#{i:04d} {params}: ожидали {truth}, получили {predicted}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 import asyncio
+import contextlib
+import functools
 import os
+import signal
+import time
 import uuid
 import tempfile
 import pathlib
 
-from aiogram import Bot, Dispatcher, F
+from aiogram import Dispatcher, F
 from aiogram.filters import CommandStart
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.types import (
@@ -12,16 +16,28 @@ from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
     ContentType,
-    FSInputFile,
-    InputMediaPhoto
 )
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from dotenv import load_dotenv
 
-from state import pending_ege_screenshot, pending_external_screenshot
+# .env — до импорта своих модулей: state.py, ocr.py и др. читают настройки при импорте
+load_dotenv()
+
+from state import (
+    pending_ege_screenshot,
+    pending_external_screenshot,
+    pending_id,
+    verified_ids,
+    user_student,
+)
+from jobqueue import JobQueue, QueueFull
+from remote_queue import add_queue_routes
+from assets import AssetRegistry
+from sender import Outbox, HIGH, LOW, make_bot
 
 
 # ─── 1. Настройка токена и списка ID ─────────────────────────
-load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN") or ""
 if not BOT_TOKEN:
     raise RuntimeError("❌ BOT_TOKEN не найден в .env")
@@ -32,27 +48,75 @@ if not BOT_TOKEN:
 raw_ids = os.getenv("STUDENT_IDS", "")
 ALLOWED_STUDENT_IDS = { i.strip() for i in raw_ids.split(",") if i.strip() }
 
-# ─── 2. Папка для временных скринов ───────────────────────────
+# ─── 2. Где держать скрины до OCR ─────────────────────────────
+# SCREEN_STORAGE=memory (по умолчанию) — скрин скачивается в память и
+# уходит воркеру байтами, диск не трогаем; disk — старый режим с TMP_DIR.
+SCREEN_STORAGE = (os.getenv("SCREEN_STORAGE") or "memory").lower()
 TMP_DIR = pathlib.Path(tempfile.gettempdir()) / "ege_screens"
-TMP_DIR.mkdir(exist_ok=True)
-
-# ─── 3. Инициализация бота и диспетчера ───────────────────────
-bot = Bot(BOT_TOKEN)
+if SCREEN_STORAGE == "disk":
+    TMP_DIR.mkdir(exist_ok=True)
+
+# ─── 3. Роль процесса и способ получения апдейтов ─────────────
+# ROLE=all — приём и OCR в одном процессе (как раньше);
+# ROLE=ingest — только приём, OCR делают отдельные `python worker.py`.
+ROLE = (os.getenv("ROLE") or "all").lower()
+# BOT_MODE=polling (по умолчанию) или webhook: Telegram сам шлёт апдейты
+# на WEBHOOK_URL + WEBHOOK_PATH, сервер слушает WEBHOOK_HOST:WEBHOOK_PORT.
+BOT_MODE = (os.getenv("BOT_MODE") or "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or ""
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH") or "/webhook"
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST") or "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or 8080)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise RuntimeError("❌ BOT_MODE=webhook, но WEBHOOK_URL не задан в .env")
+
+# ─── 4. Инициализация бота и диспетчера ───────────────────────
+bot = make_bot(BOT_TOKEN)
 dp = Dispatcher()
-queue: asyncio.Queue = asyncio.Queue()
 
-# ─── 4. Импорт воркера и листа Feedback ────────────────────────
-from worker import run_worker, feedback_sheet
+# Картинки-инструкции заливаются один раз, дальше шлём по сохранённому file_id.
+# ASSETS_RECOMPRESS=1 — перед первой заливкой пережать PNG в JPEG.
+assets = AssetRegistry(
+    os.getenv("ASSETS_CACHE") or "assets_cache.json",
+    recompress=os.getenv("ASSETS_RECOMPRESS") == "1",
+)
+
+# ─── 5. Импорт воркера и листов Google ────────────────────────
+import metrics
+import sheets
+from mirror import SheetMirror
+from feedback_writer import FeedbackWriter
+from worker import (
+    run_worker,
+    local_queues,
+    make_outbox,
+    dead_job_handler,
+    OCR_WORKERS,
+    QUEUE_TOKEN,
+    EVENTS_RETRY_SEC,
+)
+
+# Таблицу ведёт только процесс приёма: воркеры присылают распознанные баллы
+# событием "scores" (см. confirm_scores). Поиск по tg_id идёт в памяти.
+ss = sheets.open_spreadsheet()
+ege_mirror = SheetMirror(sheets.ege_sheet(ss))
+feedback_mirror = SheetMirror(sheets.feedback_sheet(ss))
+
+# Отзывы пишутся через write-behind буфер: раз в FEEDBACK_FLUSH_SEC пачкой.
+# Незаписанное при остановке сохраняется в FEEDBACK_SPOOL и дописывается при старте.
+FEEDBACK_FLUSH_SEC = float(os.getenv("FEEDBACK_FLUSH_SEC") or 5)
+feedback_writer = FeedbackWriter(feedback_mirror, os.getenv("FEEDBACK_SPOOL") or "feedback_spool.json")
+metrics.FEEDBACK_PENDING.fn = lambda: len(feedback_writer.pending)
+
+# Очередь задач OCR хранится в SQLite и переживает рестарт; её же разбирают
+# отдельные процессы-воркеры. Обратно они шлют события (см. apply_events).
+queue, events = local_queues()
 
-# ─── 5. Словари для состояний ─────────────────────────────────
-# временный контейнер «ждут ID» после отправки контакта
-pending_id: set[int] = set()
-# окончательно верифицированные пользователи
-verified_ids: set[int] = set()
-# Telegram-ID → платформенный ID
-user_student: dict[int,str] = {}
+# ─── 6. Словари для состояний ─────────────────────────────────
+# pending_id, verified_ids и user_student живут в state.py и переживают рестарт
 
-# ─── 6. /start — просим контакт ───────────────────────────────
+# ─── 7. /start — просим контакт ───────────────────────────────
 @dp.message(CommandStart())
 async def cmd_start(msg: Message):
     if msg.from_user.id in verified_ids:
@@ -71,7 +135,7 @@ async def cmd_start(msg: Message):
     )
 
 
-# ─── 7. Обработка контакта — просим ID ───────────────────────
+# ─── 8. Обработка контакта — просим ID ───────────────────────
 @dp.message(F.contact)
 async def handle_contact(msg: Message):
     # Проверяем, что это именно контакт пользователя
@@ -80,23 +144,22 @@ async def handle_contact(msg: Message):
         return
 
     # Сначала отправляем гайд по тому, где найти ID на платформе
-    media = [
-        InputMediaPhoto(media=FSInputFile("assets/id1.png")),
-        InputMediaPhoto(media=FSInputFile("assets/id2.png")),
-        InputMediaPhoto(media=FSInputFile("assets/id3.png")),
-    ]
-    await bot.send_media_group(msg.chat.id, media)
+    await assets.send_media_group(bot, msg.chat.id, [
+        ("assets/id1.png", None),
+        ("assets/id2.png", None),
+        ("assets/id3.png", None),
+    ])
     # Затем просим пользователя прислать свой ID
     pending_id.add(msg.from_user.id)
     await msg.answer("✅ Контакт получен! Пожалуйста, отправьте свой ID ученика (см. инструкции выше).")
 
 
-# ─── 8. Обработка текстового сообщения — или ID, или отзыв ─────
+# ─── 9. Обработка текстового сообщения — или ID, или отзыв ─────
 @dp.message(F.text)
 async def handle_text(msg: Message):
     user = msg.from_user.id
+    txt = msg.text.strip()
     if user in pending_id:
-        txt = msg.text.strip()
         if txt in ALLOWED_STUDENT_IDS:
             verified_ids.add(user)
             pending_id.remove(user)
@@ -106,12 +169,10 @@ async def handle_text(msg: Message):
             await msg.answer("✅ Верификация пройдена! Сейчас покажу, как сделать скрин результатов ЕГЭ.")
 
             # 2) отправляем EGE-инструкцию
-            media = [
-                InputMediaPhoto(media=FSInputFile("assets/ege1.png"),
-                                caption="📸 **Как сделать скриншот результатов ЕГЭ**"),
-                InputMediaPhoto(media=FSInputFile("assets/ege2.png"))
-            ]
-            await bot.send_media_group(msg.chat.id, media)
+            await assets.send_media_group(bot, msg.chat.id, [
+                ("assets/ege1.png", "📸 **Как сделать скриншот результатов ЕГЭ**"),
+                ("assets/ege2.png", None),
+            ])
 
             # 3) включаем флаг, что ждём именно EGE-скриншот
             pending_ege_screenshot.add(user)
@@ -123,34 +184,54 @@ async def handle_text(msg: Message):
     if user not in verified_ids:
         return
 
-    # Тут вашим уже оставшимся текстом будет отзыв
-    cell = feedback_sheet.find(str(user))
-    if cell:
-        feedback_sheet.update_cell(cell.row, 2, "text")
-        feedback_sheet.update_cell(cell.row, 3, txt)
+    # Тут вашим уже оставшимся текстом будет отзыв (в таблицу уйдёт фоном)
+    if feedback_writer.put(user, "text", txt):
         await msg.answer("✅ Спасибо, ваш отзыв обновлён!")
     else:
-        feedback_sheet.append_row([str(user), "text", txt])
         await msg.answer("✅ Спасибо, ваш отзыв сохранён!")
 
 
-# ─── 9. Обработка фото/документов ────────────────────────────
+# ─── 10. Обработка фото/документов ────────────────────────────
+async def _busy_text() -> str:
+    minutes = max(1, round(await asyncio.to_thread(queue.eta, OCR_WORKERS) / 60))
+    return f"⏳ Сейчас очень много скринов. Пришлите ваш ещё раз примерно через {minutes} мин."
+
+
 @dp.message(F.photo | F.document)
 async def handle_media(msg: Message):
     user = msg.from_user.id
 
     # 1) если ждём ЕГЭ-скрин — уходим в OCR
     if user in pending_ege_screenshot:
+        # очередь переполнена — не качаем скрин, флаг ожидания оставляем
+        if await asyncio.to_thread(queue.depth) >= queue.max_depth:
+            await msg.answer(await _busy_text())
+            return
         pending_ege_screenshot.remove(user)
-        tmp_path = TMP_DIR / f"{uuid.uuid4()}.jpg"
         file_id = msg.photo[-1].file_id if msg.photo else msg.document.file_id
-        await bot.download(file=file_id, destination=tmp_path)
-        await msg.answer("🔍 Получили скрин! Проверяем…")
-        await queue.put({
-            "tg_id": user,
-            "file": str(tmp_path),
-            "student_id": user_student.get(user, "")
-        })
+        task = {"tg_id": user, "student_id": user_student.get(user, "")}
+        started = time.perf_counter()
+        if SCREEN_STORAGE == "disk":
+            tmp_path = TMP_DIR / f"{uuid.uuid4()}.jpg"
+            await bot.download(file=file_id, destination=tmp_path)
+            task["file"] = str(tmp_path)
+        else:
+            # без destination aiogram отдаёт BytesIO
+            buf = await bot.download(file=file_id)
+            task["data"] = buf.getvalue()
+        task["timings"] = {"download": time.perf_counter() - started}
+        task["enqueued_at"] = time.time()
+        try:
+            await queue.put(task)
+        except QueueFull:
+            pending_ege_screenshot.add(user)
+            await msg.answer(await _busy_text())
+            return
+        wait = await asyncio.to_thread(queue.eta, OCR_WORKERS)
+        if wait > 60:
+            await msg.answer(f"🔍 Получили скрин! Проверяем… Примерное ожидание: ~{round(wait / 60)} мин.")
+        else:
+            await msg.answer("🔍 Получили скрин! Проверяем…")
         return
 
     # 2) если ждём скрин площадки — сохраняем его в Feedback
@@ -159,12 +240,7 @@ async def handle_media(msg: Message):
         file_id = msg.photo[-1].file_id if msg.photo else msg.document.file_id
         file = await bot.get_file(file_id)
         url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
-        cell = feedback_sheet.find(str(user))
-        if cell:
-            feedback_sheet.update_cell(cell.row, 2, "platform_screenshot")
-            feedback_sheet.update_cell(cell.row, 3, url)
-        else:
-            feedback_sheet.append_row([str(user), "platform_screenshot", url])
+        feedback_writer.put(user, "platform_screenshot", url)
         await msg.answer("✅ Скриншот с площадки сохранён!")
         return
 
@@ -173,7 +249,7 @@ async def handle_media(msg: Message):
         return
 
 
-# ─── 10. Обработка видео-отзыва ──────────────────────────────
+# ─── 11. Обработка видео-отзыва ──────────────────────────────
 @dp.message(F.video | F.video_note)
 async def handle_video_feedback(msg: Message):
     user = msg.from_user.id
@@ -184,21 +260,188 @@ async def handle_video_feedback(msg: Message):
     file = await bot.get_file(fid)
     url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
 
-    cell = feedback_sheet.find(str(user))
-    if cell:
-        feedback_sheet.update_cell(cell.row, 2, "video")
-        feedback_sheet.update_cell(cell.row, 3, url)
+    if feedback_writer.put(user, "video", url):
         await msg.answer("✅ Спасибо, ваш видео-отзыв обновлён!")
     else:
-        feedback_sheet.append_row([str(user), "video", url])
         await msg.answer("✅ Спасибо, ваш видео-отзыв сохранён!")
 
-# ─── 11. Запуск воркера и polling ─────────────────────────────
+# ─── 12. События от воркеров ─────────────────────────────────
+async def confirm_scores(outbox: Outbox, event: dict) -> bool:
+    """
+    Пишет распознанные баллы в таблицу EGE и отвечает ученику (событие
+    "scores" от воркеров). Зеркала и буфер отзывов есть только здесь,
+    поэтому строку не создадут дважды, а решение «отзыв уже есть» не
+    опирается на устаревшую копию листа.
+    Возвращает True, если теперь ждём от ученика скриншот площадки.
+    """
+    tg_id = event["tg_id"]
+    scores = event["scores"]
+    student_id = event.get("student_id", "")
+    # 1) Запись баллов (gspread синхронный — уводим в поток)
+    # ошибка Sheets (429/5xx) уходит наружу: apply_events повторит событие позже
+    sheets_started = time.perf_counter()
+    try:
+        ok = await asyncio.to_thread(sheets.matches_sheet, ege_mirror, tg_id, scores, student_id)
+    finally:
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - sheets_started, stage="sheets")
+    # «Распознано» идёт через тот же Outbox, что и подтверждение: одна очередь на чат, склеятся
+    await outbox.send_message(tg_id, f"🔍 Распознано: {scores}", priority=HIGH)
+    result_msg = "✅ Баллы подтверждены!" if ok else "⚠️ Не совпало, куратор проверит вручную."
+    await outbox.send_message(tg_id, result_msg, priority=HIGH)
+
+    if not ok:
+        return False
+    # сразу предлагаем кнопки "Редактировать баллы" и "Редактировать отзыв"
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✏️ Редактировать баллы", callback_data="edit_scores")],
+        [InlineKeyboardButton(text="✏️ Редактировать отзыв", callback_data="edit_review")],
+    ])
+    await outbox.send_message(tg_id, "Если нужно что-то поменять, выберите опцию:", reply_markup=kb,
+                              priority=HIGH)
+
+    # 2) Инструкция по отзыву на внешних площадках — если отзыва ещё нет
+    if tg_id not in feedback_writer:
+        await outbox.send_message(
+            tg_id,
+            "🟢ТЗ К ОТЗЫВАМ НА ВП (внешние площадки) 🟢\n\n"
+            "Почему ты выбрала «99 баллов»?\n"
+            "Поделись своими впечатлениями об уроках, конспектах, домашних заданиях. Может, запомнились какие-то лайфхаки или что-то на уроках оказалось для тебя наиболее ценным и эффективным?\n"
+            "Расскажи, в чем улучшились твои знания во время обучения в «99 баллов» и какой результат ты получила.\n"
+            "Кому бы ты порекомендовала нашу школу и почему?\n\n"
+            "👆 Если оставишь отзыв на ВП, то пришли скрин\n\n"
+            "Озывы ты можешь оставить на одной из этих площадок:\n"
+            "- ОТЗОВИК (в поисковике набери «отзовик 99 баллов»)\n"
+            "- Яндекс: https://yandex.ru/maps/org/99_ballov/59607351472/?ll=49.143410%2C55.787270&z=13.85\n"
+            "- Сравни: https://www.sravni.ru/shkola/99-ballov/otzyvy/\n"
+            "- 2ГИС: https://2gis.ru/kazan/firm/70000001044938528\n\n"
+            "Отзыв можно оставить в нескольких местах.\n\n"
+            "Если не хочешь оставлять отзыв, отправь просто «-».\n\n"
+            "📹 Видео-отзыв:\n"
+            "1. Держите телефон горизонтально.\n"
+            "2. Проверьте качество звука — без громких шумов.\n\n"
+            "Что рассказать:\n"
+            "- Ваше имя;\n"
+            "- Из какого города вы;\n"
+            "- На каком предмете(ах) и в каком году вы занимались;\n"
+            "- Сколько баллов вы написали на экзамене;\n"
+            "- Почему вы выбрали «99 баллов»;\n"
+            "- Ваши впечатления об уроках, конспектах и домашних заданиях;\n"
+            "- Какие лайфхаки вы вынесли;\n"
+            "- В чём улучшились ваши знания;\n"
+            "- Кому бы вы порекомендовали нашу школу и почему;\n"
+            "- Небольшое заключение и напутствие.\n"
+            "Обратная связь: @diwan1337",
+            priority=LOW,
+        )
+        # теперь мы ждём от этого пользователя именно скриншот площадки
+        await outbox.send_message(tg_id,
+                                  "🙏 Спасибо за баллы! Теперь, пожалуйста, оставьте отзыв на внешней площадке…",
+                                  priority=LOW)
+        return True
+    await outbox.send_message(
+        tg_id,
+        "🙂 Ваш отзыв уже сохранён. Чтобы обновить, отправьте новый текст или видео или скриншот площадки.",
+        priority=LOW,
+    )
+    return False
+
+
+async def apply_events(events: JobQueue, outbox: Outbox):
+    """
+    Состояние диалога, таблицу EGE и буфер отзывов меняем только здесь:
+    воркеры могут быть в других процессах, а владелец у них должен быть один.
+    """
+    await asyncio.to_thread(events.recover)  # события разбирает только этот процесс
+    while True:
+        job_id, event = await events.get()
+        try:
+            if event["event"] == "scores":
+                if await confirm_scores(outbox, event):
+                    pending_external_screenshot.add(event["tg_id"])
+            else:
+                print(f"⚠️ Неизвестное событие от воркера: {event}")
+        except Exception as exc:
+            # одна ошибка Sheets не должна ни терять баллы, ни останавливать разбор событий
+            delay = min(EVENTS_RETRY_SEC * 2 ** (event.get("attempt", 1) - 1), 600)
+            print(f"⚠️ Событие {event.get('event')} для {event.get('tg_id')} не применено, "
+                  f"повтор через {delay:.0f} с: {exc!r}")
+            events.nack(job_id, repr(exc), delay)
+            continue
+        events.ack(job_id)
+
+
+# ─── 13. Запуск: polling или webhook, воркер при ROLE=all ─────
 async def main():
-    asyncio.create_task(run_worker(bot, queue))
-    await dp.start_polling(bot)
-
-# ─── 12. Обработка нажатий на кнопки ───────────────────────────────────────────────
+    # METRICS_PORT — отдать метрики на http://METRICS_HOST:METRICS_PORT/metrics
+    metrics_runner = None
+    if os.getenv("METRICS_PORT"):
+        metrics_runner = await metrics.serve(int(os.getenv("METRICS_PORT")), os.getenv("METRICS_HOST") or "127.0.0.1")
+    # исходящие нужны и приёму без OCR: ответы по баллам шлёт он (apply_events)
+    outbox = make_outbox(bot)
+    metrics.OUTBOX_PENDING.fn = outbox.pending
+    sender = asyncio.create_task(outbox.run())
+    worker = None
+    if ROLE == "all":
+        worker = asyncio.create_task(run_worker(outbox, queue, events))
+    else:
+        metrics.QUEUE_DEPTH.fn = queue.qsize
+        # задачи удалённых воркеров умирают здесь, в очереди приёма
+        queue.on_dead = dead_job_handler(functools.partial(outbox.send_message, priority=HIGH))
+    # баллы так и не удалось записать за EVENTS_MAX_ATTEMPTS попыток — просим прислать скрин снова
+    events.on_dead = dead_job_handler(functools.partial(outbox.send_message, priority=HIGH))
+    refresher = asyncio.create_task(sheets.run_mirror_refresher([ege_mirror, feedback_mirror]))
+    flusher = asyncio.create_task(feedback_writer.run(FEEDBACK_FLUSH_SEC))
+    applier = asyncio.create_task(apply_events(events, outbox))
+
+    # HTTP-сервер приёма: вебхук и/или очереди для воркеров на других машинах
+    web_runner = None
+    if BOT_MODE == "webhook" or QUEUE_TOKEN:
+        app = web.Application()
+        if BOT_MODE == "webhook":
+            SimpleRequestHandler(dp, bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+            setup_application(app, dp, bot=bot)
+        if QUEUE_TOKEN:
+            add_queue_routes(app, {"ocr": queue, "events": events}, QUEUE_TOKEN)
+        web_runner = web.AppRunner(app)
+        await web_runner.setup()
+        await web.TCPSite(web_runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    try:
+        if BOT_MODE == "webhook":
+            await bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                                  allowed_updates=dp.resolve_used_update_types())
+            stop = asyncio.Event()
+            with contextlib.suppress(NotImplementedError):  # Windows
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+            await stop.wait()
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        # даём OCR-воркерам доработать начатые скрины
+        refresher.cancel()
+        if worker:
+            worker.cancel()
+        await asyncio.gather(*filter(None, [worker, refresher]), return_exceptions=True)
+        if web_runner:
+            await web_runner.cleanup()
+        # неразобранные события остаются в JOB_DB и применятся после рестарта
+        applier.cancel()
+        await asyncio.gather(applier, return_exceptions=True)
+        # дописываем пользователям то, что воркер и applier успели поставить в очередь
+        await outbox.close()
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        # отзывы сбрасываем последними — воркер тоже мог их наставить
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+        await feedback_writer.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await queue.close()
+        await events.close()
+        await bot.session.close()
+
+# ─── 14. Обработка нажатий на кнопки ───────────────────────────────────────────────
 @dp.callback_query(lambda c: c.data == "edit_scores")
 async def on_edit_scores(cb: CallbackQuery):
     user = cb.from_user.id
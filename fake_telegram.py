@@ -0,0 +1,202 @@
+"""
+Локальная заглушка Telegram Bot API: можно прогнать всю связку
+(приём в polling/webhook-режиме, отдельные воркеры, очередь исходящих)
+без сети и без настоящего бота. Запоминает всё, что бот отправил, и
+умеет «присылать» боту сообщения от имени пользователей.
+
+    python fake_telegram.py --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8080 \\
+        ROLE=ingest python bot.py
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python worker.py
+
+    curl -X POST 127.0.0.1:8081/_send -H 'Content-Type: application/json' -d '{"user": 1, "text": "/start"}'
+    curl -X POST 127.0.0.1:8081/_send -F user=1 -F photo=@screen.jpg
+    curl '127.0.0.1:8081/_sent?user=1'
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, flood_every: int = 0):
+        self.updates: list[dict] = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+        self.files: dict[str, bytes] = {}
+        self.sent: list[dict] = []
+        self.webhook: tuple[str, str | None] | None = None
+        self.new_update = asyncio.Event()
+        # каждый N-й sendMessage отвечает 429 — проверка обработки retry-after
+        self.flood_every = flood_every
+        self.calls = itertools.count(1)
+
+    # ─── 1. Bot API ──────────────────────────────────────────
+    async def api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        handler = getattr(self, f"m_{method}", None)
+        if handler is None:
+            print(f"… {method} — не эмулируется, отвечаем True")
+            return web.json_response({"ok": True, "result": True})
+        result = await handler(params)
+        if isinstance(result, web.Response):
+            return result
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id, **fields) -> dict:
+        return {"message_id": next(self.message_ids), "date": int(time.time()),
+                "chat": {"id": int(chat_id), "type": "private"}, "from": BOT_USER, **fields}
+
+    def _store_file(self, data: bytes) -> dict:
+        file_id = f"file{next(self.file_ids)}"
+        self.files[file_id] = data
+        return {"file_id": file_id, "file_unique_id": file_id, "width": 1080, "height": 2400, "file_size": len(data)}
+
+    def _record(self, method: str, chat_id, **fields):
+        self.sent.append({"method": method, "chat_id": int(chat_id), "at": time.time(), **fields})
+        print(f"→ {chat_id} {method}: {fields.get('text', '')[:80]!r}")
+
+    async def m_getMe(self, params):
+        return BOT_USER
+
+    async def m_setWebhook(self, params):
+        self.webhook = (params["url"], params.get("secret_token"))
+        return True
+
+    async def m_deleteWebhook(self, params):
+        self.webhook = None
+        return True
+
+    async def m_getUpdates(self, params):
+        offset = int(params.get("offset") or 0)
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates
+
+    async def m_sendMessage(self, params):
+        if self.flood_every and next(self.calls) % self.flood_every == 0:
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}})
+        markup = params.get("reply_markup")
+        self._record("sendMessage", params["chat_id"], text=params["text"], reply_markup=markup)
+        return self._message(params["chat_id"], text=params["text"])
+
+    async def m_sendMediaGroup(self, params):
+        messages = []
+        for item in json.loads(params["media"]):
+            media = item["media"]
+            if media.startswith("attach://"):
+                photo = self._store_file(params[media[len("attach://"):]].file.read())
+            else:
+                photo = {"file_id": media, "file_unique_id": media, "width": 1080, "height": 2400}
+            messages.append(self._message(params["chat_id"], photo=[photo], caption=item.get("caption")))
+        self._record("sendMediaGroup", params["chat_id"], count=len(messages))
+        return messages
+
+    async def m_getFile(self, params):
+        file_id = params["file_id"]
+        return {"file_id": file_id, "file_unique_id": file_id,
+                "file_size": len(self.files.get(file_id, b"")), "file_path": f"photos/{file_id}.jpg"}
+
+    async def m_editMessageReplyMarkup(self, params):
+        return True
+
+    async def m_answerCallbackQuery(self, params):
+        return True
+
+    async def download(self, request: web.Request) -> web.Response:
+        file_id = request.match_info["path"].rsplit("/", 1)[-1].split(".")[0]
+        if file_id not in self.files:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.files[file_id], content_type="image/jpeg")
+
+    # ─── 2. Апдейты от «пользователей» ───────────────────────
+    async def deliver(self, update: dict):
+        update["update_id"] = next(self.update_ids)
+        if self.webhook is None:
+            self.updates.append(update)
+            self.new_update.set()
+            return
+        url, secret = self.webhook
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json=update, headers=headers) as resp:
+                if resp.status != 200:
+                    print(f"⚠️ Вебхук ответил {resp.status}")
+
+    def _user_message(self, user: int, **fields) -> dict:
+        return {"message_id": next(self.message_ids), "date": int(time.time()),
+                "chat": {"id": user, "type": "private"},
+                "from": {"id": user, "is_bot": False, "first_name": f"User{user}"}, **fields}
+
+    async def send(self, request: web.Request) -> web.Response:
+        """От пользователя: {"user", "text"} / {"user", "contact": телефон} / multipart user + photo."""
+        if request.content_type == "application/json":
+            body = await request.json()
+        else:
+            body = dict(await request.post())
+        user = int(body["user"])
+        if "photo" in body:
+            data = body["photo"].file.read() if hasattr(body["photo"], "file") else open(body["photo"], "rb").read()
+            message = self._user_message(user, photo=[self._store_file(data)])
+        elif "contact" in body:
+            message = self._user_message(user, contact={"phone_number": body["contact"], "first_name": f"User{user}",
+                                                        "user_id": user})
+        else:
+            message = self._user_message(user, text=body["text"])
+        await self.deliver({"message": message})
+        return web.json_response({"ok": True})
+
+    async def press(self, request: web.Request) -> web.Response:
+        """Нажатие inline-кнопки: {"user", "data"}."""
+        body = await request.json()
+        user = int(body["user"])
+        await self.deliver({"callback_query": {
+            "id": str(next(self.update_ids)), "chat_instance": str(user), "data": body["data"],
+            "from": {"id": user, "is_bot": False, "first_name": f"User{user}"},
+            "message": self._message(user, text="…"),
+        }})
+        return web.json_response({"ok": True})
+
+    async def sent_log(self, request: web.Request) -> web.Response:
+        user = request.query.get("user")
+        return web.json_response([m for m in self.sent if user is None or m["chat_id"] == int(user)])
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.api)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.download)
+        app.router.add_post("/_send", self.send)
+        app.router.add_post("/_press", self.press)
+        app.router.add_get("/_sent", self.sent_log)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API для локальной проверки")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--flood-every", type=int, default=0, help="каждый N-й sendMessage отвечать 429")
+    args = parser.parse_args()
+    web.run_app(FakeTelegram(args.flood_every).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
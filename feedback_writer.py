@@ -0,0 +1,126 @@
+import asyncio
+import json
+import pathlib
+import threading
+
+
+class FeedbackWriter:
+    """
+    Write-behind буфер для листа Feedback.
+    Хэндлеры только кладут отзыв в память и сразу отвечают пользователю;
+    повторные отзывы одного tg_id схлопываются (остаётся последний),
+    а фоновая задача пишет накопленное пачкой: один batch_update для
+    существующих строк и один append_rows для новых.
+    """
+
+    def __init__(self, mirror, spool_path: str | pathlib.Path):
+        self.mirror = mirror
+        self.spool = pathlib.Path(spool_path)
+        self.lock = threading.Lock()
+        # flush() может идти одновременно из run() и close(): поток отменённого
+        # run() дорабатывает сам, и его _requeue не должен прийти после spool
+        self.flush_lock = threading.Lock()
+        # tg_id → (feedback_type, content)
+        self.pending: dict[str, tuple[str, str]] = {}
+        self._load_spool()
+
+    def put(self, tg_id, feedback_type: str, content: str) -> bool:
+        """Ставит отзыв в очередь. True — если у пользователя уже был отзыв."""
+        key = str(tg_id)
+        existed = key in self
+        with self.lock:
+            self.pending[key] = (feedback_type, content)
+        return existed
+
+    def __contains__(self, tg_id) -> bool:
+        key = str(tg_id)
+        with self.lock:
+            if key in self.pending:
+                return True
+        return self.mirror.row_of(key) is not None
+
+    # ─── запись в таблицу ────────────────────────────────────
+    def flush(self):
+        """Синхронно пишет всё накопленное. При ошибке возвращает невыписанное в буфер."""
+        with self.flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return
+
+        updates: dict[int, dict[int, str]] = {}
+        appends: dict[str, tuple[str, str]] = {}
+        for key, (ftype, content) in batch.items():
+            row = self.mirror.row_of(key)
+            if row:
+                updates[row] = {2: ftype, 3: content}
+            else:
+                appends[key] = (ftype, content)
+
+        try:
+            self.mirror.update_rows(updates)
+        except Exception:
+            self._requeue({k: v for k, v in batch.items() if k not in appends})
+            self._requeue(appends)
+            raise
+        try:
+            self.mirror.append_rows([[key, ftype, content] for key, (ftype, content) in appends.items()])
+        except Exception:
+            self._requeue(appends)
+            raise
+        # всё записано — spool от прошлого запуска больше не нужен
+        self._save_spool()
+
+    def _requeue(self, batch: dict[str, tuple[str, str]]):
+        # более свежий отзыв, пришедший во время записи, не перетираем
+        with self.lock:
+            for key, value in batch.items():
+                self.pending.setdefault(key, value)
+
+    async def run(self, interval: float, max_backoff: float = 300):
+        """Фоновый сброс буфера каждые `interval` сек, при ошибках — экспоненциальный backoff."""
+        delay = interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.to_thread(self.flush)
+                delay = interval
+            except Exception as exc:
+                delay = min(delay * 2, max_backoff)
+                print(f"⚠️ Не удалось записать отзывы, повтор через {delay:.0f} с: {exc}")
+
+    async def close(self, attempts: int = 3):
+        """Финальный сброс при остановке; что не удалось записать — в spool-файл."""
+        delay = 1.0
+        for attempt in range(attempts):
+            try:
+                await asyncio.to_thread(self.flush)
+                break
+            except Exception as exc:
+                print(f"⚠️ Сброс отзывов при остановке не удался: {exc}")
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        self._save_spool()
+
+    # ─── spool: переживаем рестарт без потери отзывов ────────
+    def _save_spool(self):
+        with self.lock:
+            pending = dict(self.pending)
+        if pending:
+            tmp = self.spool.with_suffix(".tmp")
+            tmp.write_text(json.dumps(pending, ensure_ascii=False), encoding="utf-8")
+            tmp.replace(self.spool)
+        elif self.spool.exists():
+            self.spool.unlink()
+
+    def _load_spool(self):
+        if not self.spool.exists():
+            return
+        data = json.loads(self.spool.read_text(encoding="utf-8"))
+        with self.lock:
+            for key, (ftype, content) in data.items():
+                self.pending.setdefault(key, (ftype, content))
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+
+class QueueFull(Exception):
+    """Очередь заполнена до max_depth — новую задачу не принимаем."""
+
+
+class JobQueue:
+    """
+    Персистентная очередь задач OCR на SQLite с доставкой at-least-once.
+    get() «забирает» задачу на visibility_timeout секунд; если за это время
+    не было ack() (процесс упал, его убили при деплое), задача снова
+    становится видимой. После max_attempts выдач задача уходит в статус dead.
+    Картинка хранится отдельной BLOB-колонкой, остальные поля — JSON.
+    В одном файле может жить несколько очередей (`name`): задачи OCR и
+    события от воркеров обратно к приёму. Файл можно открыть из нескольких
+    процессов на одной машине — так несколько воркеров разбирают одну очередь.
+    Пока соседний процесс держит запись, SQLite ждёт до 30 с, поэтому из
+    event loop к базе ходим через asyncio.to_thread: get/put — корутины,
+    а ack/nack, как у RemoteJobQueue, уходят в фоне и дожидаются в close().
+    """
+
+    def __init__(self, path: str, name: str = "ocr", max_depth: int = 500, visibility_timeout: float = 300,
+                 max_attempts: int = 3, poll_interval: float = 0.5, dead_retention: float = 7 * 86400):
+        self.path = path
+        self.name = name
+        # on_dead(task) — вызывается, когда задача окончательно ушла в dead
+        # (ответить пользователю, удалить временный файл); подставляет владелец очереди
+        self.on_dead = None
+        self.max_depth = max_depth
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        # dead-задачи храним dead_retention секунд (last_error для разбора), потом удаляем
+        self.dead_retention = dead_retention
+        self._purged_at = 0.0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload     TEXT    NOT NULL,
+                data        BLOB,
+                status      TEXT    NOT NULL DEFAULT 'ready',
+                attempts    INTEGER NOT NULL DEFAULT 0,
+                visible_at  REAL    NOT NULL,
+                created_at  REAL    NOT NULL,
+                last_error  TEXT,
+                queue       TEXT    NOT NULL DEFAULT 'ocr'
+            )""")
+        # файл от версии без колонки queue — все задачи в нём были задачами OCR
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        if "queue" not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN queue TEXT NOT NULL DEFAULT 'ocr'")
+        self.db.execute("DROP INDEX IF EXISTS jobs_ready")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_queue_ready ON jobs (queue, status, visible_at, id)")
+        # среднее время обработки общее для всех процессов, которые делят файл
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self._wakeup: asyncio.Event | None = None
+        self._claimed_at: dict[int, float] = {}
+        self._pending: set[asyncio.Task] = set()
+        self._depth = 0
+        self._measuring: asyncio.Task | None = None
+
+    # ─── постановка ──────────────────────────────────────────
+    def depth(self) -> int:
+        """Сколько задач ждут или обрабатываются."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status IN ('ready', 'running')", (self.name,)
+            ).fetchone()[0]
+
+    def qsize(self) -> int:
+        """
+        Глубина по последнему замеру — для метрик: /metrics отвечает из event loop,
+        а COUNT(*) там может ждать блокировку SQLite, поэтому новый замер — в фоне.
+        """
+        if self._measuring is None or self._measuring.done():
+            self._measuring = asyncio.get_running_loop().create_task(self._measure())
+            self._pending.add(self._measuring)
+            self._measuring.add_done_callback(self._pending.discard)
+        return self._depth
+
+    async def _measure(self):
+        try:
+            self._depth = await asyncio.to_thread(self.depth)
+        except Exception as exc:
+            print(f"⚠️ Очередь {self.name}: не удалось посчитать глубину: {exc!r}")
+
+    @property
+    def avg_seconds(self) -> float:
+        """Скользящее среднее времени обработки — для оценки ожидания."""
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (f"avg_seconds:{self.name}",)).fetchone()
+        return row[0] if row else 20.0
+
+    def eta(self, workers: int) -> float:
+        """Примерное ожидание новой задачи, сек."""
+        return (self.depth() + 1) * self.avg_seconds / max(workers, 1)
+
+    async def put(self, task: dict) -> int:
+        """Сохраняет задачу; при переполнении бросает QueueFull."""
+        job_id = await asyncio.to_thread(self._insert, task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def _insert(self, task: dict) -> int:
+        task = dict(task)
+        data = task.pop("data", None)
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                depth = self.db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status IN ('ready', 'running')", (self.name,)
+                ).fetchone()[0]
+                self._depth = depth
+                if depth >= self.max_depth:
+                    raise QueueFull(depth)
+                cur = self.db.execute(
+                    "INSERT INTO jobs (queue, payload, data, visible_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.name, json.dumps(task, ensure_ascii=False), data, now, now),
+                )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        self._depth = depth + 1
+        return cur.lastrowid
+
+    # ─── выдача ──────────────────────────────────────────────
+    def _claim(self) -> tuple[tuple[int, dict] | None, list[dict]]:
+        """(выданная задача или None, задачи, которые только что ушли в dead)."""
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                # задачи, которые выдавали max_attempts раз и так и не подтвердили
+                dead = self.db.execute(
+                    "SELECT id, payload FROM jobs "
+                    "WHERE queue = ? AND status IN ('ready', 'running') AND visible_at <= ? AND attempts >= ?",
+                    (self.name, now, self.max_attempts),
+                ).fetchall()
+                # visible_at у dead-задачи — момент, когда она умерла (для dead_retention)
+                self.db.executemany(
+                    "UPDATE jobs SET status = 'dead', data = NULL, visible_at = ? WHERE id = ?",
+                    [(now, job_id) for job_id, _ in dead],
+                )
+                if now - self._purged_at > 60:
+                    self._purged_at = now
+                    self.db.execute(
+                        "DELETE FROM jobs WHERE queue = ? AND status = 'dead' AND visible_at < ?",
+                        (self.name, now - self.dead_retention),
+                    )
+                row = self.db.execute(
+                    "SELECT id, payload, data, attempts FROM jobs "
+                    "WHERE queue = ? AND status IN ('ready', 'running') AND visible_at <= ? "
+                    "ORDER BY id LIMIT 1",
+                    (self.name, now),
+                ).fetchone()
+                if row is not None:
+                    self.db.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, visible_at = ? "
+                        "WHERE id = ?",
+                        (now + self.visibility_timeout, row[0]),
+                    )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        dead_tasks = [json.loads(payload) for _, payload in dead]
+        if row is None:
+            return None, dead_tasks
+        job_id, payload, data, attempts = row
+        task = json.loads(payload)
+        if data is not None:
+            task["data"] = bytes(data)
+        task["attempt"] = attempts + 1
+        self._claimed_at[job_id] = time.monotonic()
+        return (job_id, task), dead_tasks
+
+    def _died(self, tasks: list[dict]):
+        if self.on_dead is None:
+            return
+        for task in tasks:
+            try:
+                self.on_dead(task)
+            except Exception as exc:
+                print(f"⚠️ on_dead для задачи {task.get('tg_id')}: {exc}")
+
+    async def get(self) -> tuple[int, dict]:
+        """Ждёт и забирает следующую задачу: (job_id, task)."""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while True:
+            claim = asyncio.ensure_future(asyncio.to_thread(self._claim))
+            try:
+                claimed, dead = await asyncio.shield(claim)
+            except asyncio.CancelledError:
+                # поток всё равно может успеть забрать задачу — сразу возвращаем её в очередь
+                claim.add_done_callback(self._release)
+                raise
+            self._died(dead)
+            if claimed is not None:
+                return claimed
+            self._wakeup.clear()
+            # задачи могут ставить и другие процессы — поэтому ещё и опрос по таймеру
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _release(self, claim: asyncio.Future):
+        if claim.cancelled() or claim.exception() is not None:
+            return
+        claimed, dead = claim.result()
+        self._died(dead)
+        if claimed is not None:
+            self._claimed_at.pop(claimed[0], None)
+            self._background(self._unclaim, claimed[0])
+
+    def _unclaim(self, job_id: int):
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET status = 'ready', attempts = attempts - 1, visible_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    # ─── подтверждение ───────────────────────────────────────
+    def _background(self, fn, *args):
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(fn, *args))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        task.add_done_callback(self._settled)
+
+    def _settled(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            # не записалось — задача сама вернётся в очередь после visibility timeout
+            print(f"⚠️ Очередь {self.name}: {exc!r}")
+        elif task.result() is not None:
+            self._died([task.result()])
+
+    def ack(self, job_id: int):
+        """Задача обработана — удаляем её вместе с картинкой (в фоне)."""
+        started = self._claimed_at.pop(job_id, None)
+        self._background(self._ack, job_id, None if started is None else time.monotonic() - started)
+
+    def _ack(self, job_id: int, seconds: float | None):
+        with self.lock:
+            self.db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            if seconds is not None:
+                self.db.execute(
+                    "INSERT INTO meta (key, value) VALUES (?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = 0.8 * value + 0.2 * excluded.value",
+                    (f"avg_seconds:{self.name}", seconds),
+                )
+
+    def nack(self, job_id: int, error: str = "", delay: float = 5):
+        """Вернуть задачу в очередь через `delay` секунд (или в dead после max_attempts), в фоне."""
+        self._claimed_at.pop(job_id, None)
+        self._background(self._nack, job_id, error, delay)
+
+    def _nack(self, job_id: int, error: str, delay: float) -> dict | None:
+        """Возвращает задачу, если она ушла в dead: on_dead вызываем уже в event loop."""
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'ready' END, "
+                "data = CASE WHEN attempts >= ? THEN NULL ELSE data END, "
+                "visible_at = ?, last_error = ? WHERE id = ?",
+                (self.max_attempts, self.max_attempts, time.time() + delay, error[:500], job_id),
+            )
+            row = self.db.execute(
+                "SELECT payload FROM jobs WHERE id = ? AND status = 'dead'", (job_id,)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def recover(self) -> int:
+        """
+        При старте единственного воркера: задачи, которые он не успел
+        доделать до рестарта, сразу снова доступны (не ждём visibility_timeout).
+        Если очередь разбирают несколько процессов, вызывать нельзя — заберём
+        задачи, которые сейчас обрабатывают соседи.
+        """
+        with self.lock:
+            cur = self.db.execute(
+                "UPDATE jobs SET status = 'ready', visible_at = ? WHERE queue = ? AND status = 'running'",
+                (time.time(), self.name),
+            )
+        return cur.rowcount
+
+    async def close(self):
+        if self._pending:
+            await asyncio.wait(self._pending, timeout=10)
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,163 @@
+import threading
+import time
+
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# Минимальная реализация метрик в текстовом формате Prometheus:
+# своих зависимостей не тянем, aiohttp уже есть вместе с aiogram.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY: list["Metric"] = []
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+    return "{" + inner + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, dict(key), value) for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+    """Значение задаётся через set() или вычисляется при каждом скрейпе через fn."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn=None):
+        super().__init__(name, help_text)
+        self.fn = fn
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        return [(self.name, {}, float(self.fn()) if self.fn else self.value)]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        # labels → ([счётчики по бакетам], сумма, количество)
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total, count = self.series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.series[key] = [counts, total + value, count + 1]
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, (counts, total, count) in self.series.items():
+                labels = dict(key)
+                for bound, c in zip(self.buckets, counts):
+                    out.append((f"{self.name}_bucket", {**labels, "le": f"{bound:g}"}, c))
+                out.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, count))
+                out.append((f"{self.name}_sum", labels, total))
+                out.append((f"{self.name}_count", labels, count))
+        return out
+
+
+def render() -> str:
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+
+# ─── Метрики бота ────────────────────────────────────────────
+STAGE_SECONDS = Histogram(
+    "ocr_stage_seconds",
+    "Длительность стадий обработки скрина (download, queue_wait, decode, preprocess, ocr, sheets, total)",
+)
+TASKS = Counter("ocr_tasks_total", "Обработанные задачи OCR по результату")
+OCR_PASSES = Counter("ocr_passes_total", "Проходы Tesseract (быстрый + дорогие)")
+CACHE_LOOKUPS = Counter("ocr_cache_lookups_total", "Поиски в кэше OCR: exact, near, miss")
+SHEETS_SECONDS = Histogram("sheets_api_seconds", "Длительность запросов к Google Sheets API по операциям")
+SHEETS_ERRORS = Counter("sheets_api_errors_total", "Ошибки запросов к Google Sheets API")
+# источники значений для гейджей подставляют worker.py и bot.py
+QUEUE_DEPTH = Gauge("ocr_queue_depth", "Скринов в очереди на OCR")
+INFLIGHT = Gauge("ocr_inflight_tasks", "Скринов в обработке прямо сейчас")
+FEEDBACK_PENDING = Gauge("feedback_pending", "Отзывов в буфере, ещё не записанных в таблицу")
+OUTBOX_PENDING = Gauge("outbox_pending", "Исходящих сообщений в очереди на отправку")
+OUTBOX_SENT = Counter("outbox_sent_total", "Отправки из очереди исходящих: ok, merged, retry_after, error")
+
+
+@contextmanager
+def sheets_call(op: str):
+    """Оборачивает один запрос к Sheets API: время, количество и ошибки."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SHEETS_ERRORS.inc(op=op)
+        raise
+    finally:
+        SHEETS_SECONDS.observe(time.perf_counter() - started, op=op)
+
+
+# ─── HTTP-эндпоинт ───────────────────────────────────────────
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def serve(port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    """Поднимает GET /metrics; вернувшийся runner нужно закрыть через cleanup()."""
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,173 @@
+import re
+import threading
+import time
+
+from gspread.utils import rowcol_to_a1
+
+from metrics import sheets_call
+
+# «'EGE'!A12:F12» → 12
+_UPDATED_ROW_RE = re.compile(r"![A-Z]+(\d+)")
+
+
+class SheetMirror:
+    """
+    Локальная копия листа Google Sheets.
+    Загружается одним get_all_values(), держит индексы
+    «ключ из первой колонки → номер строки» и «заголовок → номер колонки».
+    Все наши записи идут через зеркало, поэтому оно остаётся актуальным;
+    правки кураторов подтягиваются через refresh(). Перед записью ключи
+    целевых строк сверяются с листом: куратор мог вставить или отсортировать
+    строки, и номер из зеркала уже указывает на чужую строку.
+    """
+
+    def __init__(self, ws, key_col: int = 1):
+        self.ws = ws
+        self.key_col = key_col
+        # lock — короткие чтения/подмена данных, io_lock — сетевые записи и refresh
+        self.lock = threading.RLock()
+        self.io_lock = threading.RLock()
+        self.rows: list[list[str]] = []
+        self.header: list[str] = []
+        self.columns: dict[str, int] = {}
+        self.index: dict[str, int] = {}
+        self.loaded_at = 0.0
+        self.refresh()
+
+    # ─── загрузка ────────────────────────────────────────────
+    def refresh(self):
+        """Перечитывает лист целиком (1 запрос к API)."""
+        with self.io_lock:
+            with sheets_call("get_all_values"):
+                values = self.ws.get_all_values()
+            with self.lock:
+                self.rows = [list(r) for r in values]
+                self.header = self.rows[0] if self.rows else []
+                self.columns = {name: i + 1 for i, name in enumerate(self.header) if name}
+                self.index = {}
+                for i, row in enumerate(self.rows[1:], start=2):
+                    key = row[self.key_col - 1].strip() if len(row) >= self.key_col else ""
+                    if key:
+                        self.index.setdefault(key, i)
+                self.loaded_at = time.time()
+
+    # ─── чтение (без обращений к API) ────────────────────────
+    def row_of(self, key) -> int | None:
+        """Номер строки (1-based) по ключу или None."""
+        with self.lock:
+            return self.index.get(str(key).strip())
+
+    def col_of(self, name: str) -> int | None:
+        """Номер колонки (1-based) по заголовку или None."""
+        with self.lock:
+            return self.columns.get(name)
+
+    def get(self, key) -> dict[str, str] | None:
+        """Строка по ключу в виде {заголовок: значение}."""
+        with self.lock:
+            row_idx = self.index.get(str(key).strip())
+            if row_idx is None:
+                return None
+            row = self.rows[row_idx - 1]
+            return {name: (row[col - 1] if col <= len(row) else "") for name, col in self.columns.items()}
+
+    def __contains__(self, key) -> bool:
+        return self.row_of(key) is not None
+
+    def _key_at(self, row_idx: int) -> str:
+        row = self.rows[row_idx - 1] if row_idx <= len(self.rows) else []
+        return row[self.key_col - 1].strip() if len(row) >= self.key_col else ""
+
+    # ─── запись (API + локальная копия) ──────────────────────
+    def _col(self, col: int | str) -> int:
+        return col if isinstance(col, int) else self.columns[col]
+
+    def update_row(self, row_idx: int, changes: dict[int | str, str]):
+        """Пишет несколько ячеек одной строки одним batch_update."""
+        self.update_rows({row_idx: changes})
+
+    def update_rows(self, changes: dict[int, dict[int | str, str]]):
+        """Пишет ячейки нескольких строк одним batch_update."""
+        cells = {
+            row_idx: {self._col(c): str(v) for c, v in row.items()}
+            for row_idx, row in changes.items() if row
+        }
+        if not cells:
+            return
+        with self.io_lock:
+            cells = self._verify_rows(cells)
+            if not cells:
+                return
+            with sheets_call("batch_update"):
+                self.ws.batch_update(
+                    [
+                        {"range": rowcol_to_a1(row_idx, col), "values": [[val]]}
+                        for row_idx, row in cells.items() for col, val in row.items()
+                    ],
+                    raw=False,  # как update_cell: числа остаются числами
+                )
+            with self.lock:
+                for row_idx, row in cells.items():
+                    self._set_local(row_idx, row)
+
+    def _verify_rows(self, cells: dict[int, dict[int, str]]) -> dict[int, dict[int, str]]:
+        """
+        Читает ключевые ячейки целевых строк одним batch_get. Если хоть одна
+        не совпала с зеркалом — перечитывает лист и находит строки заново
+        по ключу; строки, чей ключ из листа пропал, не пишутся.
+        """
+        with self.lock:
+            expected = {row_idx: self._key_at(row_idx) for row_idx in cells}
+        with sheets_call("batch_get"):
+            actual = self.ws.batch_get([rowcol_to_a1(row_idx, self.key_col) for row_idx in expected])
+        moved = [
+            row_idx for row_idx, got in zip(expected, actual)
+            if (got[0][0] if got and got[0] else "").strip() != expected[row_idx]
+        ]
+        if not moved:
+            return cells
+        print(f"⚠️ Строки {moved} листа {self.ws.title} сдвинулись — перечитываю лист")
+        self.refresh()
+        resolved: dict[int, dict[int, str]] = {}
+        for row_idx, row in cells.items():
+            if row_idx in moved:
+                key = expected[row_idx]
+                row_idx = self.row_of(key) if key else None
+                if row_idx is None:
+                    print(f"⚠️ Ключа {key!r} больше нет в листе {self.ws.title} — запись пропущена")
+                    continue
+            resolved.setdefault(row_idx, {}).update(row)
+        return resolved
+
+    def append_row(self, values: list[str]) -> int:
+        """Добавляет строку в конец листа, возвращает её номер."""
+        return self.append_rows([values])[0]
+
+    def append_rows(self, rows: list[list[str]]) -> list[int]:
+        """Добавляет строки одним append_rows, возвращает их номера."""
+        if not rows:
+            return []
+        with self.io_lock:
+            with sheets_call("append_rows"):
+                resp = self.ws.append_rows(rows)
+            m = _UPDATED_ROW_RE.search(resp.get("updates", {}).get("updatedRange", ""))
+            with self.lock:
+                first = int(m.group(1)) if m else len(self.rows) + 1
+                for i, values in enumerate(rows):
+                    self._set_local(first + i, {j + 1: str(v) for j, v in enumerate(values)})
+            return list(range(first, first + len(rows)))
+
+    def _set_local(self, row_idx: int, cells: dict[int, str]):
+        while len(self.rows) < row_idx:
+            self.rows.append([])
+        row = self.rows[row_idx - 1]
+        width = max(cells)
+        if len(row) < width:
+            row.extend([""] * (width - len(row)))
+        for col, val in cells.items():
+            row[col - 1] = val
+        if row_idx == 1:
+            self.header = row
+            self.columns = {name: i + 1 for i, name in enumerate(row) if name}
+        elif self.key_col in cells and cells[self.key_col].strip():
+            self.index.setdefault(cells[self.key_col].strip(), row_idx)
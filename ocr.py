@@ -0,0 +1,265 @@
+import bisect
+import os
+import re
+import time
+import cv2
+import numpy as np
+
+from ocr_engine import engines
+
+# Модуль намеренно не трогает Telegram и Google Sheets: его импортируют
+# процессы OCR-пула, и подключение к таблице там не нужно.
+
+# ─── 1. Регулярка и словарь предметов ─────────────────────────
+PAIR_RE = re.compile(r"([А-ЯЁа-яё() ]+)[\s\n]+(\d{1,3})")
+ALIASES = {
+    "математика профильная": "math",
+    "математика профиль":    "math",
+    "физика":                "phys",
+    "русский язык":          "rus",
+    "информатика":           "inf",
+    "информатика кегэ":      "inf",
+    "информатика (кегэ)":    "inf",
+}
+
+
+# ─── 2. Адаптивный препроцессинг ──────────────────────────────
+# Масштаб подбираем под реальную высоту символов: Tesseract лучше всего
+# читает глифы ~20–30 px, поэтому мелкий скрин растягиваем (не больше MAX_SCALE),
+# а крупный — не трогаем или даже уменьшаем.
+# OCR_ROI=0 отключает обрезку до области с текстом.
+TARGET_GLYPH_PX = 24
+MIN_SCALE, MAX_SCALE = 0.5, 3.0
+OCR_ROI = os.getenv("OCR_ROI", "1") != "0"
+
+
+def load_image(source: str | bytes, flags: int = cv2.IMREAD_COLOR):
+    """Читает картинку с диска (путь) или декодирует прямо из байтов в памяти."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(source, np.uint8), flags)
+    else:
+        img = cv2.imread(source, flags)
+    if img is None:
+        raise ValueError("не удалось прочитать изображение")
+    return img
+
+
+def _text_mask(gray):
+    """Бинаризация «текст = белый» на исходном разрешении."""
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # тёмная тема: текст светлый, после INV фоном стал бы белый — разворачиваем
+    if cv2.countNonZero(bw) > bw.size // 2:
+        bw = cv2.bitwise_not(bw)
+    return bw
+
+
+def glyph_height(bw) -> float | None:
+    """Медианная высота символа по связным компонентам (None — текста не нашли)."""
+    _, _, stats, _ = cv2.connectedComponentsWithStats(bw, connectivity=8)
+    h = stats[1:, cv2.CC_STAT_HEIGHT]
+    w = stats[1:, cv2.CC_STAT_WIDTH]
+    # отбрасываем точки, линии-разделители и крупные иконки
+    glyphs = (h >= 4) & (h <= bw.shape[0] // 10) & (w <= h * 3)
+    if glyphs.sum() < 10:
+        return None
+    return float(np.median(h[glyphs]))
+
+
+def pick_scale(glyph: float | None) -> float:
+    if not glyph:
+        return MAX_SCALE  # не смогли оценить — ведём себя как раньше (×3)
+    return float(np.clip(TARGET_GLYPH_PX / glyph, MIN_SCALE, MAX_SCALE))
+
+
+def text_region(bw, glyph: float | None) -> tuple[int, int, int, int]:
+    """
+    Прямоугольник (x, y, w, h) с таблицей баллов: символы склеиваются
+    в строки дилатацией, строки статус-бара и нижней панели телефона
+    (касаются верхних/нижних 3 % кадра) отбрасываются.
+    """
+    img_h, img_w = bw.shape
+    g = int(glyph or 10)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (g * 2, max(g // 2, 1)))
+    lines = cv2.dilate(bw, kernel)
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    band = int(img_h * 0.03)
+    boxes = []
+    for c in contours:
+        x, y, w, h = cv2.boundingRect(c)
+        if y <= band or y + h >= img_h - band:
+            continue
+        if h < g // 2 or h > g * 6:  # шум или картинка, а не строка текста
+            continue
+        boxes.append((x, y, x + w, y + h))
+    if not boxes:
+        return 0, 0, img_w, img_h
+
+    pad = g
+    x0 = max(min(b[0] for b in boxes) - pad, 0)
+    y0 = max(min(b[1] for b in boxes) - pad, 0)
+    x1 = min(max(b[2] for b in boxes) + pad, img_w)
+    y1 = min(max(b[3] for b in boxes) + pad, img_h)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def preprocess(source):
+    """Серый → обрезка до текста → масштаб по высоте глифа → CLAHE → Otsu."""
+    # 1) сразу в один канал: JPEG декодируется только по яркости
+    gray = source if isinstance(source, np.ndarray) else load_image(source, cv2.IMREAD_GRAYSCALE)
+
+    # 2) высота символов и область с текстом — на исходном разрешении
+    bw = _text_mask(gray)
+    glyph = glyph_height(bw)
+    if OCR_ROI:
+        x, y, w, h = text_region(bw, glyph)
+        gray = gray[y:y + h, x:x + w]
+
+    # 3) адаптивный масштаб вместо фиксированного ×3
+    scale = pick_scale(glyph)
+    if abs(scale - 1.0) > 0.1:
+        interp = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interp)
+
+    # 4) CLAHE по яркости + Otsu threshold
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    gray = clahe.apply(gray)
+    _, thr = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thr
+
+
+def _pairs(text: str):
+    """(код предмета, балл, позиция балла в тексте) для каждой пары «предмет — балл»."""
+    for m in PAIR_RE.finditer(text):
+        subj = re.sub(r"[()]", "", m.group(1)).strip().lower()
+        for alias, code in ALIASES.items():
+            if alias in subj:
+                yield code, int(m.group(2)), m.start(2)
+                break
+
+
+def parse_scores(text: str) -> dict[str, int]:
+    """Достаёт из текста OCR пары «предмет — балл» и нормализует предметы через ALIASES."""
+    return {code: val for code, val, _ in _pairs(text)}
+
+
+# ─── 3. Многопроходное распознавание ──────────────────────────
+# Сначала дешёвый проход на исходном разрешении. Дорогие проходы
+# (адаптивный препроцессинг, другие PSM) запускаем, только если баллов нет,
+# на скрине упомянут предмет без балла или Tesseract не уверен
+# в цифрах балла (уверенность ниже OCR_MIN_CONF, 0–100).
+OCR_MIN_CONF = float(os.getenv("OCR_MIN_CONF") or 80)
+# OCR_DEBUG=1 — печатать сырой текст каждого прохода
+OCR_DEBUG = os.getenv("OCR_DEBUG") == "1"
+
+
+def mentioned_subjects(text: str) -> set[str]:
+    """Коды предметов, названия которых встречаются в тексте (с баллом или без)."""
+    norm = re.sub(r"\s+", " ", re.sub(r"[()]", "", text).lower())
+    return {code for alias, code in ALIASES.items() if re.sub(r"[()]", "", alias) in norm}
+
+
+def read_pass(img, psm: int) -> tuple[dict[str, int], dict[str, float], str]:
+    """Один проход OCR: баллы, уверенность в каждом балле и сырой текст."""
+    with engines.checkout() as engine:
+        words = engine.image_to_data(img, psm=psm)
+
+    lines: dict[tuple[int, int, int], list[tuple[str, float]]] = {}
+    for line, word, conf in words:
+        lines.setdefault(line, []).append((word, conf))
+
+    # собираем текст, запоминая, с какой позиции начинается каждое слово:
+    # уверенность балла — это уверенность именно того слова, которое
+    # PAIR_RE взял как балл предмета, а не любого слова с теми же цифрами
+    chunks: list[str] = []
+    offsets: list[int] = []
+    word_conf: list[float] = []
+    pos = 0
+    for ws in lines.values():
+        for i, (word, conf) in enumerate(ws):
+            chunk = word + (" " if i < len(ws) - 1 else "\n")
+            offsets.append(pos)
+            word_conf.append(conf)
+            chunks.append(chunk)
+            pos += len(chunk)
+    text = "".join(chunks).rstrip("\n")
+
+    scores: dict[str, int] = {}
+    conf: dict[str, float] = {}
+    for code, val, at in _pairs(text):
+        scores[code] = val
+        conf[code] = word_conf[bisect.bisect_right(offsets, at) - 1]
+    return scores, conf, text
+
+
+def _lap(timings: dict[str, float] | None, stage: str, started: float):
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def _passes(source, timings: dict[str, float] | None = None):
+    """Проходы от дешёвого к дорогому; картинки готовятся лениво."""
+    started = time.perf_counter()
+    gray = load_image(source, cv2.IMREAD_GRAYSCALE)
+    _lap(timings, "decode", started)
+    yield "fast", gray, 6
+    started = time.perf_counter()
+    thr = preprocess(gray)
+    _lap(timings, "preprocess", started)
+    yield "full", thr, 6      # блок текста
+    yield "columns", thr, 4   # одна колонка строк разной высоты
+    yield "sparse", thr, 11   # разрозненный текст
+
+
+def extract_scores(source: str | bytes, timings: dict[str, float] | None = None) -> dict[str, int]:
+    """
+    Оцифровывает картинку (путь или байты), извлекает пары «предмет — балл».
+    Если передан `timings`, в него складываются секунды по стадиям
+    (decode / preprocess / ocr) и число проходов (passes).
+    """
+    scores: dict[str, int] = {}
+    conf: dict[str, float] = {}
+    mentioned: set[str] = set()
+
+    for name, img, psm in _passes(source, timings):
+        started = time.perf_counter()
+        found, found_conf, text = read_pass(img, psm)
+        _lap(timings, "ocr", started)
+        if timings is not None:
+            timings["passes"] = timings.get("passes", 0) + 1
+        if OCR_DEBUG:
+            print(f"RAW OCR ({name}):\n", text)
+
+        # из всех проходов берём для каждого предмета самый уверенный балл
+        for code, val in found.items():
+            if found_conf[code] > conf.get(code, -1.0):
+                scores[code], conf[code] = val, found_conf[code]
+        mentioned |= mentioned_subjects(text)
+
+        missing = mentioned - scores.keys()
+        if scores and not missing and min(conf.values()) >= OCR_MIN_CONF:
+            break
+    return scores
+
+
+def extract_scores_timed(source: str | bytes) -> tuple[dict[str, int], dict[str, float]]:
+    """extract_scores для OCR-пула: тайминги возвращаются вместе с баллами."""
+    timings: dict[str, float] = {}
+    return extract_scores(source, timings), timings
+
+
+def image_phash(source) -> int:
+    """64-битный dHash: устойчив к пережатию JPEG и масштабу, для кэша почти-дубликатов."""
+    # декодируем сразу в 1/8 разрешения — это в разы быстрее полного декода
+    gray = load_image(source, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def init_process():
+    """Инициализатор процесса OCR-пула: один поток на процесс и прогретый движок."""
+    # Параллелизм даёт сам пул; внутренние потоки cv2/OpenMP только мешали бы друг другу.
+    cv2.setNumThreads(1)
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    engines.warmup()
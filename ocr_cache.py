@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import time
+
+from collections import OrderedDict
+
+
+class OcrCache:
+    """
+    LRU-кэш результатов OCR.
+    Точный ключ — sha256 содержимого файла (одинаковые и пересланные скрины).
+    Запасной — перцептивный хэш картинки: пережатая копия того же скрина
+    даёт хэш на расстоянии нескольких бит. Скрины Госуслуг у разных учеников
+    выглядят почти одинаково и отличаются только цифрами, поэтому поиск
+    по перцептивному хэшу идёт только среди скринов того же пользователя (scope).
+    """
+
+    def __init__(self, max_items: int = 2000, ttl: float = 86400, max_distance: int = 4,
+                 path: str | None = None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.path = path
+        # sha256 → (время записи, phash, scope, баллы)
+        self.items: OrderedDict[str, tuple[float, int, str, dict[str, int]]] = OrderedDict()
+        self.hits = {"exact": 0, "near": 0}
+        self.misses = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def content_key(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key: str) -> dict[str, int] | None:
+        """Поиск по точному хэшу содержимого."""
+        item = self.items.get(key)
+        if item is None or self._expired(item):
+            self.items.pop(key, None)
+            return None
+        self.items.move_to_end(key)
+        self.hits["exact"] += 1
+        return dict(item[3])
+
+    def get_near(self, phash: int, scope) -> dict[str, int] | None:
+        """Поиск почти-дубликата среди скринов того же scope (tg_id)."""
+        scope = str(scope)
+        best_key, best_dist = None, self.max_distance + 1
+        for key, (ts, other, other_scope, _) in self.items.items():
+            if other_scope != scope:
+                continue
+            dist = (phash ^ other).bit_count()
+            if dist < best_dist:
+                best_key, best_dist = key, dist
+        if best_key is None or self._expired(self.items[best_key]):
+            self.misses += 1
+            return None
+        self.items.move_to_end(best_key)
+        self.hits["near"] += 1
+        return dict(self.items[best_key][3])
+
+    def put(self, key: str, phash: int, scope, scores: dict[str, int]):
+        # пустой результат не кэшируем: пусть повторная отправка распознаётся заново
+        if not scores:
+            return
+        self.items[key] = (time.time(), phash, str(scope), dict(scores))
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self.items), "hits_exact": self.hits["exact"],
+                "hits_near": self.hits["near"], "misses": self.misses}
+
+    def _expired(self, item) -> bool:
+        return time.time() - item[0] > self.ttl
+
+    # ─── сохранение между рестартами (если задан path) ───────
+    def save(self):
+        if not self.path:
+            return
+        data = [[key, *item] for key, item in self.items.items() if not self._expired(item)]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        for key, ts, phash, scope, scores in data:
+            item = (ts, phash, scope, scores)
+            if not self._expired(item):
+                self.items[key] = item
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
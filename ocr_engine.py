@@ -0,0 +1,170 @@
+import os
+import queue
+import threading
+
+from contextlib import contextmanager
+
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # биндинги к C API не обязательны — есть pytesseract
+    tesserocr = None
+
+# ─── 1. Конфигурация Tesseract ───────────────────────────────
+# Для Windows указываем бинарь явно
+TESS_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+if os.path.exists(TESS_PATH):
+    pytesseract.pytesseract.tesseract_cmd = TESS_PATH
+
+# OCR_BACKEND: auto — tesserocr, если установлен, иначе pytesseract;
+# tesserocr / pytesseract — принудительно.
+OCR_BACKEND = (os.getenv("OCR_BACKEND") or "auto").lower()
+OCR_LANG = "rus"
+
+
+# ─── 2. Движки ───────────────────────────────────────────────
+class PytesseractEngine:
+    """Запасной путь: на каждый вызов — отдельный процесс tesseract."""
+
+    name = "pytesseract"
+
+    def image_to_string(self, img, psm: int = 6) -> str:
+        # oem 3 = LSTM
+        return pytesseract.image_to_string(img, lang=OCR_LANG, config=f"--oem 3 --psm {psm}")
+
+    def image_to_data(self, img, psm: int = 6) -> list[tuple[tuple[int, int, int], str, float]]:
+        tsv = pytesseract.image_to_data(img, lang=OCR_LANG, config=f"--oem 3 --psm {psm}")
+        return parse_tsv(tsv)
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """Долгоживущий TessBaseAPI: traineddata загружается один раз на движок."""
+
+    name = "tesserocr"
+
+    def __init__(self):
+        self.api = tesserocr.PyTessBaseAPI(lang=OCR_LANG, oem=tesserocr.OEM.DEFAULT)
+
+    def _set_image(self, img, psm: int):
+        # img — uint8 из cv2; Tesseract не копирует буфер, поэтому отдаём свой bytes
+        height, width = img.shape[:2]
+        channels = 1 if img.ndim == 2 else img.shape[2]
+        data = img.tobytes()
+        self.api.SetPageSegMode(psm)
+        self.api.SetImageBytes(data, width, height, channels, width * channels)
+        return data
+
+    def image_to_string(self, img, psm: int = 6) -> str:
+        data = self._set_image(img, psm)  # noqa: F841 — буфер должен жить до конца распознавания
+        try:
+            return self.api.GetUTF8Text()
+        finally:
+            self.api.Clear()
+
+    def image_to_data(self, img, psm: int = 6) -> list[tuple[tuple[int, int, int], str, float]]:
+        data = self._set_image(img, psm)  # noqa: F841 — буфер должен жить до конца распознавания
+        try:
+            return parse_tsv(self.api.GetTSVText(0))
+        finally:
+            self.api.Clear()
+
+    def close(self):
+        self.api.End()
+
+
+def parse_tsv(tsv: str) -> list[tuple[tuple[int, int, int], str, float]]:
+    """
+    TSV-вывод Tesseract → [((block, par, line), слово, уверенность 0–100)].
+    Формат одинаков у `tesseract … tsv` и TessBaseAPI::GetTSVText.
+    """
+    words = []
+    for row in tsv.splitlines():
+        cols = row.split("\t")
+        # level=5 — слово; строка заголовка pytesseract отсеется здесь же
+        if len(cols) < 12 or cols[0] != "5" or not cols[11].strip():
+            continue
+        try:
+            conf = float(cols[10])
+        except ValueError:
+            continue
+        words.append(((int(cols[2]), int(cols[3]), int(cols[4])), cols[11], conf))
+    return words
+
+
+def make_engine():
+    """Создаёт движок согласно OCR_BACKEND (auto откатывается на pytesseract)."""
+    if OCR_BACKEND in ("auto", "tesserocr") and tesserocr is not None:
+        try:
+            return TesserocrEngine()
+        except RuntimeError as exc:
+            if OCR_BACKEND == "tesserocr":
+                raise
+            print(f"⚠️ tesserocr не инициализировался ({exc}), использую pytesseract")
+    elif OCR_BACKEND == "tesserocr":
+        raise RuntimeError("❌ OCR_BACKEND=tesserocr, но пакет tesserocr не установлен")
+    return PytesseractEngine()
+
+
+# ─── 3. Пул прогретых движков ────────────────────────────────
+class EnginePool:
+    """
+    Пул инициализированных движков. Движок берётся на время одного
+    распознавания через checkout() и возвращается обратно; упавший
+    движок выбрасывается и при нехватке создаётся новый.
+    """
+
+    def __init__(self, size: int = 1, factory=make_engine):
+        self.size = size
+        self.factory = factory
+        self.free: queue.LifoQueue = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def warmup(self):
+        """Создаёт все движки заранее, чтобы загрузка модели не попала на первый скрин."""
+        while True:
+            with self.lock:
+                if self.created >= self.size:
+                    return
+                self.created += 1
+            self.free.put(self.factory())
+
+    @contextmanager
+    def checkout(self):
+        engine = self._acquire()
+        try:
+            yield engine
+        except Exception:
+            # движок мог остаться в неконсистентном состоянии — не возвращаем его
+            with self.lock:
+                self.created -= 1
+            engine.close()
+            raise
+        self.free.put(engine)
+
+    def _acquire(self):
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            can_create = self.created < self.size
+            if can_create:
+                self.created += 1
+        if can_create:
+            try:
+                return self.factory()
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+        return self.free.get()
+
+
+# Один пул на процесс. В OCR-пуле каждый процесс распознаёт по одному скрину
+# за раз, так что по умолчанию ему хватает одного движка.
+engines = EnginePool(int(os.getenv("OCR_ENGINES_PER_PROCESS") or 1))
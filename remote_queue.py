@@ -0,0 +1,145 @@
+import asyncio
+import base64
+
+import aiohttp
+from aiohttp import web
+
+from jobqueue import JobQueue
+
+# Воркеры на других машинах не видят SQLite-файл приёма, поэтому приём
+# отдаёт свои очереди по HTTP (рядом с вебхуком), а удалённый воркер
+# работает с ними через RemoteJobQueue — тот же интерфейс, что у JobQueue.
+# Семантика не меняется: задача «забирается» на visibility_timeout и
+# вернётся в очередь, если воркер пропал, не подтвердив её.
+
+LONG_POLL_SEC = 10
+
+
+def _encode(task: dict) -> dict:
+    task = dict(task)
+    if task.get("data") is not None:
+        task["data"] = base64.b64encode(task["data"]).decode("ascii")
+    return task
+
+
+def _decode(task: dict) -> dict:
+    if task.get("data") is not None:
+        task["data"] = base64.b64decode(task["data"])
+    return task
+
+
+# ─── сервер (процесс приёма) ─────────────────────────────────
+def add_queue_routes(app: web.Application, queues: dict[str, JobQueue], token: str):
+    """Вешает на app эндпоинты /queue/{name}/... для удалённых воркеров."""
+
+    def _queue(request: web.Request) -> JobQueue:
+        if request.headers.get("Authorization") != f"Bearer {token}":
+            raise web.HTTPForbidden()
+        q = queues.get(request.match_info["name"])
+        if q is None:
+            raise web.HTTPNotFound()
+        return q
+
+    async def claim(request: web.Request) -> web.Response:
+        q = _queue(request)
+        try:
+            job_id, task = await asyncio.wait_for(q.get(), LONG_POLL_SEC)
+        except asyncio.TimeoutError:
+            return web.Response(status=204)
+        depth = await asyncio.to_thread(q.depth)
+        return web.json_response({"id": job_id, "task": _encode(task), "depth": depth})
+
+    async def ack(request: web.Request) -> web.Response:
+        q = _queue(request)
+        q.ack((await request.json())["id"])
+        return web.json_response({"ok": True})
+
+    async def nack(request: web.Request) -> web.Response:
+        q = _queue(request)
+        body = await request.json()
+        q.nack(body["id"], body.get("error", ""), body.get("delay", 5))
+        return web.json_response({"ok": True})
+
+    async def put(request: web.Request) -> web.Response:
+        q = _queue(request)
+        job_id = await q.put(_decode(await request.json()))
+        return web.json_response({"id": job_id})
+
+    app.router.add_post("/queue/{name}/claim", claim)
+    app.router.add_post("/queue/{name}/ack", ack)
+    app.router.add_post("/queue/{name}/nack", nack)
+    app.router.add_post("/queue/{name}/put", put)
+
+
+# ─── клиент (удалённый воркер) ───────────────────────────────
+class RemoteJobQueue:
+    """
+    Очередь приёма, доступная по HTTP. ack/nack, как у JobQueue, не ждут:
+    запрос уходит в фоне, а close() дожидается отправленных подтверждений.
+    """
+
+    def __init__(self, url: str, token: str, name: str = "ocr", max_attempts: int = 3, retry_sec: float = 2):
+        self.url = f"{url.rstrip('/')}/queue/{name}"
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_sec = retry_sec
+        self.last_depth = 0
+        self._session: aiohttp.ClientSession | None = None
+        self._pending: set[asyncio.Task] = set()
+
+    def _client(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers, timeout=aiohttp.ClientTimeout(total=LONG_POLL_SEC + 20))
+        return self._session
+
+    async def _post(self, op: str, body: dict) -> dict | None:
+        async with self._client().post(f"{self.url}/{op}", json=body) as resp:
+            resp.raise_for_status()
+            return None if resp.status == 204 else await resp.json()
+
+    async def get(self) -> tuple[int, dict]:
+        while True:
+            try:
+                reply = await self._post("claim", {})
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                print(f"⚠️ Очередь {self.url} недоступна: {exc}")
+                await asyncio.sleep(self.retry_sec)
+                continue
+            if reply is not None:
+                self.last_depth = reply["depth"]
+                return reply["id"], _decode(reply["task"])
+
+    async def put(self, task: dict) -> int:
+        return (await self._post("put", _encode(task)))["id"]
+
+    def _background(self, op: str, body: dict):
+        async def send():
+            try:
+                await self._post(op, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                # не дошло — задача сама вернётся в очередь после visibility timeout
+                print(f"⚠️ {op} задачи {body['id']} не доставлен: {exc}")
+        task = asyncio.get_running_loop().create_task(send())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def ack(self, job_id: int):
+        self._background("ack", {"id": job_id})
+
+    def nack(self, job_id: int, error: str = "", delay: float = 5):
+        self._background("nack", {"id": job_id, "error": error, "delay": delay})
+
+    def recover(self) -> int:
+        return 0  # очередь общая — «чужие» задачи вернутся по visibility timeout
+
+    def qsize(self) -> int:
+        """Глубина очереди на момент последней выданной задачи."""
+        return self.last_depth
+
+    async def close(self):
+        if self._pending:
+            await asyncio.wait(self._pending, timeout=10)
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,215 @@
+"""
+Пакетное перераспознавание архива скринов: после правок препроцессинга
+или ALIASES, или когда куратор оспаривает результат. Скрины читаются
+потоком из папки или архива (.zip, .tar, .tar.gz), распознаются пулом
+процессов, сверяются с листом EGE и записываются двумя запросами:
+один batch_update для существующих строк и один append_rows для новых.
+
+Манифест — CSV с колонками file, tg_id, student_id (file — путь внутри
+папки/архива). Если у ученика несколько скринов, баллы объединяются
+в порядке манифеста: повторный предмет берётся из более позднего скрина.
+
+    python reprocess.py archive.zip --manifest manifest.csv --dry-run --out diff.csv
+    python reprocess.py screens/ --manifest manifest.csv --workers 8
+"""
+import argparse
+import csv
+import os
+import pathlib
+import sys
+import tarfile
+import time
+import zipfile
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+# настройки OCR_* ocr.py читает при импорте — .env должен быть загружен до него
+load_dotenv()
+import ocr
+import sheets
+
+from mirror import SheetMirror
+
+IMAGE_EXT = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+# ─── 1. Источники скринов ────────────────────────────────────
+def iter_images(source: pathlib.Path):
+    """(имя внутри источника, байты) по одному — весь архив в память не читаем."""
+    if source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.suffix.lower() in IMAGE_EXT:
+                yield path.relative_to(source).as_posix(), path.read_bytes()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and pathlib.PurePosixPath(info.filename).suffix.lower() in IMAGE_EXT:
+                    yield info.filename, zf.read(info)
+    elif tarfile.is_tarfile(source):
+        # r:* — сжатие определяется само; потоковое чтение по порядку членов
+        with tarfile.open(source, "r:*") as tf:
+            for member in tf:
+                if member.isfile() and pathlib.PurePosixPath(member.name).suffix.lower() in IMAGE_EXT:
+                    yield member.name, tf.extractfile(member).read()
+    else:
+        sys.exit(f"❌ {source}: ожидается папка, .zip или .tar")
+
+
+def load_manifest(path: pathlib.Path) -> dict[str, tuple[str, str]]:
+    """file → (tg_id, student_id)."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return {
+            row["file"].strip().removeprefix("./"): (row["tg_id"].strip(), (row.get("student_id") or "").strip())
+            for row in csv.DictReader(f)
+            if row.get("file") and row.get("tg_id")
+        }
+
+
+# ─── 2. Распознавание ────────────────────────────────────────
+def recognize(name: str, data: bytes) -> tuple[str, dict[str, int] | str, dict[str, float]]:
+    """(имя, баллы или текст ошибки, тайминги): один битый файл не должен ронять весь прогон."""
+    try:
+        scores, timings = ocr.extract_scores_timed(data)
+    except Exception as exc:
+        return name, f"{type(exc).__name__}: {exc}", {}
+    return name, scores, timings
+
+
+def run_ocr(items, workers: int):
+    """Прогоняет (имя, байты) через пул; в полёте не больше 2×workers скринов."""
+    with ProcessPoolExecutor(workers, initializer=ocr.init_process) as pool:
+        pending = set()
+        for name, data in items:
+            pending.add(pool.submit(recognize, name, data))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (f.result() for f in done)
+        for f in pending:
+            yield f.result()
+
+
+# ─── 3. Отчёт ────────────────────────────────────────────────
+def write_diff(rows: list[dict], out):
+    writer = csv.DictWriter(out, fieldnames=["tg_id", "student_id", "action", "column", "old", "new", "files"])
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перераспознать архив скринов и обновить лист EGE")
+    parser.add_argument("source", type=pathlib.Path, help="папка, .zip или .tar(.gz) со скринами")
+    parser.add_argument("--manifest", type=pathlib.Path, required=True, help="CSV: file,tg_id,student_id")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов OCR")
+    parser.add_argument("--dry-run", action="store_true", help="ничего не писать в таблицу, только diff")
+    parser.add_argument("--out", type=pathlib.Path, help="куда сохранить diff в CSV (по умолчанию stdout при --dry-run)")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    if not manifest:
+        sys.exit("❌ Манифест пуст или без колонок file, tg_id")
+
+    # ─── распознаём ───
+    read_bytes = 0
+    skipped: list[str] = []
+    seen: set[str] = set()
+    empty: list[str] = []
+    failed: list[str] = []
+
+    def wanted():
+        nonlocal read_bytes
+        for name, data in iter_images(args.source):
+            if name not in manifest:
+                skipped.append(name)
+                continue
+            seen.add(name)
+            read_bytes += len(data)
+            yield name, data
+
+    started = time.perf_counter()
+    recognized: dict[str, dict[str, int]] = {}
+    stage_totals: dict[str, float] = {}
+    done = 0
+    for name, scores, timings in run_ocr(wanted(), args.workers):
+        done += 1
+        if done % 50 == 0:
+            print(f"… {done} скринов, {done / (time.perf_counter() - started):.1f} скр/с", file=sys.stderr)
+        for stage, sec in timings.items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + sec
+        if isinstance(scores, str):
+            failed.append(f"{name} ({scores})")
+            continue
+        if not scores:
+            empty.append(name)
+            continue
+        recognized[name] = scores
+    ocr_wall = time.perf_counter() - started
+
+    # пул отдаёт результаты в порядке готовности — объединяем в порядке манифеста,
+    # чтобы при повторе предмета всегда побеждал один и тот же (более поздний) скрин
+    # tg_id → (student_id, объединённые баллы, файлы)
+    students: dict[str, tuple[str, dict[str, int], list[str]]] = {}
+    for name, (tg_id, student_id) in manifest.items():
+        if name in recognized:
+            _, merged, files = students.setdefault(tg_id, (student_id, {}, []))
+            merged.update(recognized[name])
+            files.append(name)
+
+    # ─── сверяем с таблицей: лист EGE читается один раз, уже после OCR ───
+    ege_mirror = SheetMirror(sheets.ege_sheet(sheets.open_spreadsheet()))
+    updates: dict[int, dict[str, str]] = {}
+    appends: list[list[str]] = []
+    diff: list[dict] = []
+    for tg_id, (student_id, scores, files) in students.items():
+        row_idx, changed = sheets.plan_scores(ege_mirror, tg_id, scores, student_id)
+        if not changed:
+            continue
+        current = ege_mirror.get(tg_id) or {}
+        action = "append" if row_idx is None else "update"
+        for column, value in changed.items():
+            diff.append({"tg_id": tg_id, "student_id": student_id, "action": action, "column": column,
+                         "old": current.get(column, ""), "new": value, "files": ";".join(files)})
+        if row_idx is None:
+            appends.append(sheets.new_row(ege_mirror, changed))
+        else:
+            updates[row_idx] = changed
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            write_diff(diff, f)
+    elif args.dry_run:
+        write_diff(diff, sys.stdout)
+
+    # ─── пишем: два запроса на весь архив ───
+    if not args.dry_run:
+        write_started = time.perf_counter()
+        with ege_mirror.io_lock:
+            ege_mirror.update_rows(updates)
+            ege_mirror.append_rows(appends)
+        print(f"Записано: {len(updates)} строк обновлено, {len(appends)} добавлено "
+              f"за {time.perf_counter() - write_started:.2f} с", file=sys.stderr)
+
+    # ─── отчёт ───
+    total = time.perf_counter() - started
+    print(f"Скринов: {done} ({read_bytes / 1e6:.1f} МБ), процессов: {args.workers}", file=sys.stderr)
+    print(f"OCR: {ocr_wall:.2f} с, {done / ocr_wall if ocr_wall else 0:.2f} скр/с, "
+          f"{read_bytes / 1e6 / ocr_wall if ocr_wall else 0:.2f} МБ/с; всего {total:.2f} с", file=sys.stderr)
+    if done:
+        means = ", ".join(f"{stage} {sec / done * 1000:.0f} мс" for stage, sec in stage_totals.items() if stage != "passes")
+        print(f"В среднем на скрин: {means}, проходов OCR {stage_totals.get('passes', 0) / done:.2f}", file=sys.stderr)
+    print(f"Учеников с изменениями: {len(updates) + len(appends)}, ячеек: {len(diff)}", file=sys.stderr)
+    if failed:
+        print(f"❌ Ошибки ({len(failed)}): {'; '.join(failed[:5])}{' …' if len(failed) > 5 else ''}", file=sys.stderr)
+    if empty:
+        print(f"⚠️ Без баллов ({len(empty)}): {', '.join(empty[:10])}{' …' if len(empty) > 10 else ''}", file=sys.stderr)
+    if skipped:
+        print(f"⚠️ Нет в манифесте ({len(skipped)}): {', '.join(skipped[:10])}{' …' if len(skipped) > 10 else ''}",
+              file=sys.stderr)
+    missing = set(manifest) - seen
+    if missing:
+        print(f"⚠️ Из манифеста не найдено в {args.source}: {len(missing)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from collections import deque
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+import metrics
+
+# Приоритеты: меньше — раньше
+HIGH, NORMAL, LOW = 0, 1, 2
+
+MAX_TEXT = 4096  # лимит Telegram на длину сообщения
+
+
+def make_bot(token: str) -> Bot:
+    """
+    Bot для любой роли. TELEGRAM_API_URL — другой адрес Bot API: свой
+    telegram-bot-api сервер или fake_telegram.py для локальной проверки.
+    """
+    api_url = os.getenv("TELEGRAM_API_URL")
+    if not api_url:
+        return Bot(token)
+    return Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+
+
+class TokenBucket:
+    """Token bucket: `rate` токенов в секунду, не больше `burst` подряд."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self) -> float:
+        """Сколько ждать до следующего токена (0 — можно слать сейчас)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def _retrieve(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+
+class _Message:
+    __slots__ = ("text", "priority", "reply_markup", "future")
+
+    def __init__(self, text: str, priority: int, reply_markup, future: asyncio.Future):
+        self.text = text
+        self.priority = priority
+        self.reply_markup = reply_markup
+        self.future = future
+
+
+class Outbox:
+    """
+    Центральный планировщик исходящих сообщений.
+    - Сообщения одному чату уходят строго по порядку; несколько подряд идущих
+      текстов склеиваются в одно (клавиатура допускается только у последнего).
+    - Общий и по-чатовый лимиты — token bucket (по умолчанию ~25 msg/s на бота
+      и 1 msg/s на чат с небольшим burst, как в рекомендациях Telegram).
+    - Чаты с сообщениями высокого приоритета обслуживаются первыми.
+    - TelegramRetryAfter не всплывает к вызывающему: ждём и повторяем.
+    """
+
+    def __init__(self, bot, global_rate: float = 25, chat_rate: float = 1, chat_burst: float = 3,
+                 linger: float = 0.3):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        # первое сообщение чата ждёт `linger` секунд, чтобы успели подъехать следующие
+        self.linger = linger
+        self.chats: dict[int, deque[_Message]] = {}
+        self.busy: set[int] = set()
+        self.ready: list[tuple[int, int, int]] = []
+        self.seq = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.sending: set[asyncio.Task] = set()
+
+    # ─── постановка ──────────────────────────────────────────
+    async def send_message(self, chat_id: int, text: str, reply_markup=None,
+                           priority: int = NORMAL) -> asyncio.Future:
+        """Ставит сообщение в очередь; future завершится отправленным Message."""
+        future = asyncio.get_running_loop().create_future()
+        # ошибку отправки уже залогировал _deliver; забираем её, чтобы asyncio
+        # не ругался «exception was never retrieved», если future никто не ждёт
+        future.add_done_callback(_retrieve)
+        queue = self.chats.get(chat_id)
+        fresh = not queue
+        if fresh:
+            queue = self.chats[chat_id] = deque()
+        queue.append(_Message(text, priority, reply_markup, future))
+        if fresh and self.linger:
+            asyncio.get_running_loop().call_later(self.linger, self._schedule, chat_id)
+        else:
+            self._schedule(chat_id)
+        return future
+
+    def _schedule(self, chat_id: int):
+        queue = self.chats.get(chat_id)
+        if queue:
+            priority = min(m.priority for m in queue)
+            heapq.heappush(self.ready, (priority, next(self.seq), chat_id))
+            self.wakeup.set()
+
+    def pending(self) -> int:
+        return sum(len(q) for q in self.chats.values())
+
+    # ─── диспетчер ───────────────────────────────────────────
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.ready:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            _, _, chat_id = heapq.heappop(self.ready)
+            if chat_id in self.busy or not self.chats.get(chat_id):
+                continue  # устаревшая запись или чат уже обслуживается
+
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            wait = bucket.delay()
+            if wait > 0:
+                loop.call_later(wait, self._schedule, chat_id)
+                continue
+
+            while (wait := self.global_bucket.delay()) > 0:
+                await asyncio.sleep(wait)
+            self.global_bucket.take()
+            bucket.take()
+
+            batch = self._coalesce(self.chats[chat_id])
+            self.busy.add(chat_id)
+            task = asyncio.create_task(self._deliver(chat_id, batch, bucket))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    @staticmethod
+    def _coalesce(queue: deque[_Message]) -> list[_Message]:
+        """Забирает из головы очереди тексты, которые можно отправить одним сообщением."""
+        batch = [queue.popleft()]
+        length = len(batch[0].text)
+        while queue and batch[-1].reply_markup is None:
+            nxt = queue[0]
+            if length + 2 + len(nxt.text) > MAX_TEXT:
+                break
+            batch.append(queue.popleft())
+            length += 2 + len(nxt.text)
+        return batch
+
+    async def _deliver(self, chat_id: int, batch: list[_Message], bucket: TokenBucket):
+        text = "\n\n".join(m.text for m in batch)
+        try:
+            message = await self.bot.send_message(chat_id, text, reply_markup=batch[-1].reply_markup)
+        except TelegramRetryAfter as exc:
+            # flood control: ставим пачку обратно в голову очереди и ждём сколько сказали
+            self.chats[chat_id].extendleft(reversed(batch))
+            bucket.pause(exc.retry_after)
+            self.global_bucket.pause(exc.retry_after)
+            metrics.OUTBOX_SENT.inc(result="retry_after")
+        except Exception as exc:
+            metrics.OUTBOX_SENT.inc(result="error")
+            for m in batch:
+                if not m.future.done():
+                    m.future.set_exception(exc)
+            if not isinstance(exc, TelegramForbiddenError):  # бота заблокировали — это не ошибка
+                print(f"⚠️ Не удалось отправить сообщение {chat_id}: {exc}")
+        else:
+            metrics.OUTBOX_SENT.inc(result="ok")
+            if len(batch) > 1:
+                metrics.OUTBOX_SENT.inc(len(batch) - 1, result="merged")
+            for m in batch:
+                if not m.future.done():
+                    m.future.set_result(message)
+        finally:
+            self.busy.discard(chat_id)
+            if self.chats.get(chat_id):
+                self._schedule(chat_id)
+            else:
+                self.chats.pop(chat_id, None)
+            if len(self.chat_buckets) > 10_000:
+                self._prune()
+
+    def _prune(self):
+        # вёдра давно молчавших чатов уже полные — они ничего не ограничивают
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            if chat_id not in self.chats and bucket.delay() == 0 and bucket.tokens >= bucket.burst:
+                del self.chat_buckets[chat_id]
+
+    async def close(self, timeout: float = 10):
+        """Ждёт, пока очередь опустеет (не дольше timeout)."""
+        deadline = time.monotonic() + timeout
+        while (self.pending() or self.sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
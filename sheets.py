@@ -0,0 +1,132 @@
+import asyncio
+import os
+
+import gspread
+
+from gspread.exceptions import WorksheetNotFound, SpreadsheetNotFound
+
+from mirror import SheetMirror
+
+# Работа с Google-таблицей: листы EGE и Feedback. Импорт модуля ничего не
+# делает — подключается к таблице и грузит зеркала тот, кто с ней работает:
+# процесс приёма (bot.py) и reprocess.py. Воркерам OCR таблица не нужна.
+
+# SHEETS_REFRESH_SEC — как часто перечитывать листы целиком, чтобы
+# подхватить ручные правки кураторов.
+SHEETS_REFRESH_SEC = float(os.getenv("SHEETS_REFRESH_SEC") or 300)
+
+
+# ─── 1. Подключение ──────────────────────────────────────────
+def open_spreadsheet():
+    spreadsheet_id = os.getenv("SPREADSHEET_ID") or ""
+    if not spreadsheet_id:
+        raise RuntimeError("❌ SPREADSHEET_ID не найден в .env")
+    gc = gspread.service_account(
+        filename="google_key.json",
+        scopes=[
+            "https://www.googleapis.com/auth/spreadsheets",
+            "https://www.googleapis.com/auth/drive",
+        ],
+    )
+    try:
+        return gc.open_by_key(spreadsheet_id)
+    except SpreadsheetNotFound:
+        raise RuntimeError("❌ Таблица не найдена или нет доступа.")
+
+
+def ege_sheet(ss):
+    """Основная таблица баллов (EGE)."""
+    try:
+        return ss.worksheet("EGE")
+    except WorksheetNotFound:
+        # Заголовки предметов должны быть добавлены администратором вручную.
+        return ss.add_worksheet("EGE", rows=200, cols=30)
+
+
+def feedback_sheet(ss):
+    """Лист с отзывами."""
+    try:
+        return ss.worksheet("Feedback")
+    except WorksheetNotFound:
+        ws = ss.add_worksheet("Feedback", rows=100, cols=3)
+        ws.append_row(["tg_id", "feedback_type", "content"])
+        return ws
+
+
+async def run_mirror_refresher(mirrors: list[SheetMirror], interval: float = SHEETS_REFRESH_SEC):
+    """Периодически перечитывает листы (по одному запросу на лист)."""
+    while True:
+        await asyncio.sleep(interval)
+        for mirror in mirrors:
+            try:
+                await asyncio.to_thread(mirror.refresh)
+            except Exception as exc:
+                print(f"⚠️ Не удалось обновить лист {mirror.ws.title}: {exc}")
+
+
+# ─── 2. Баллы в листе EGE ────────────────────────────────────
+def plan_scores(mirror: SheetMirror, tg_id: int, scores: dict[str, int],
+                student_id: str) -> tuple[int | None, dict[str, str]]:
+    """
+    Что нужно поменять в таблице EGE, по зеркалу и без запросов к API:
+    (номер строки ученика или None — строку надо добавить, {колонка: новое значение}).
+    """
+    header = mirror.header
+    row_idx = mirror.row_of(tg_id)
+    if row_idx is None:
+        changed: dict[str, str] = {header[0] if header else "tg_id": str(tg_id)}
+        if "student_id" in header and student_id:
+            changed["student_id"] = student_id
+        for subj, val in scores.items():
+            if subj in header:
+                changed[subj] = str(val)
+        return None, changed
+
+    current = mirror.get(tg_id)
+    changed = {}
+    # student_id пишем, только если он ещё пуст
+    if "student_id" in header and student_id and not current.get("student_id"):
+        changed["student_id"] = student_id
+    for subj, val in scores.items():
+        if subj in header and current.get(subj) != str(val):
+            changed[subj] = str(val)
+    return row_idx, changed
+
+
+def new_row(mirror: SheetMirror, changed: dict[str, str]) -> list[str]:
+    """Строка для append_row из плана plan_scores."""
+    header = mirror.header
+    if not header:
+        return list(changed.values())[:1]
+    row = [""] * len(header)
+    for name, val in changed.items():
+        row[header.index(name)] = val
+    return row
+
+
+def sync_scores(mirror: SheetMirror, tg_id: int, scores: dict[str, int], student_id: str) -> dict[str, str]:
+    """
+    Записывает баллы ученика в таблицу EGE. Строка и заголовок берутся
+    из зеркала, так что к API уходит ровно один запрос на запись
+    (append_row или batch_update) и ни одного — если ничего не поменялось.
+    Возвращает реально изменённые ячейки: {колонка: новое значение}.
+    """
+    # io_lock: две задачи не должны одновременно создать строку одному ученику
+    with mirror.io_lock:
+        row_idx, changed = plan_scores(mirror, tg_id, scores, student_id)
+        if row_idx is None:
+            mirror.append_row(new_row(mirror, changed))
+        else:
+            mirror.update_row(row_idx, changed)
+        return changed
+
+
+def matches_sheet(mirror: SheetMirror, tg_id: int, scores: dict[str, int], student_id: str) -> bool:
+    """
+    Сверяет/дописывает баллы в таблицу EGE:
+    - Если пользователя нет — добавляет новую строку.
+    - Иначе обновляет отличающиеся баллы (одним batch-запросом).
+    Всегда возвращает True (считаем проверку пройденной).
+    """
+    sync_scores(mirror, tg_id, scores, student_id)
+    return True
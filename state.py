@@ -1,5 +1,171 @@
+import json
+import os
+import threading
+
+from dotenv import load_dotenv
+
+# Состояния диалога живут в памяти, но каждое изменение дописывается строкой
+# в журнал STATE_FILE. При старте журнал проигрывается заново (миллисекунды
+# даже на десятках тысяч пользователей), так что после деплоя никому
+# не нужно заново проходить /start, контакт и ввод ID.
+# .env подгружаем сами: модуль импортируется раньше, чем bot.py читает конфиг
+load_dotenv()
+STATE_FILE = os.getenv("STATE_FILE") or "state.log"
+
+
+class StateStore:
+    """Журнал изменений (JSON Lines) для PersistentSet / PersistentDict."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data: dict[str, dict] = {}
+        self.lines = 0
+        self._replay()
+        self.log = open(path, "a", encoding="utf-8", buffering=1)
+
+    def set(self, name: str) -> "PersistentSet":
+        return PersistentSet(self, name)
+
+    def dict(self, name: str) -> "PersistentDict":
+        return PersistentDict(self, name)
+
+    def write(self, op: str, name: str, key, value=None):
+        record = {"op": op, "n": name, "k": key}
+        if op == "set":
+            record["v"] = value
+        with self.lock:
+            self.log.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.lines += 1
+
+    def _trim_tail(self):
+        """Отрезает недописанную последнюю строку, чтобы новые записи не склеились с ней."""
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # ищем конец последней целой строки
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                nl = chunk.rfind(b"\n")
+                if nl != -1:
+                    f.truncate(pos - step + nl + 1)
+                    return
+                pos -= step
+            f.truncate(0)
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        self._trim_tail()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # недописанная строка после аварийной остановки
+                self.lines += 1
+                values = self.data.setdefault(rec["n"], {})
+                if rec["op"] == "del":
+                    values.pop(rec["k"], None)
+                else:
+                    values[rec["k"]] = rec.get("v")
+        # журнал сильно длиннее живых записей — переписываем его снимком
+        live = sum(len(v) for v in self.data.values())
+        if self.lines > 2 * live + 1000:
+            self._compact()
+
+    def _compact(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for name, values in self.data.items():
+                for key, value in values.items():
+                    f.write(json.dumps({"op": "set", "n": name, "k": key, "v": value}, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self.lines = sum(len(v) for v in self.data.values())
+
+
+class PersistentSet:
+    """Множество с записью изменений в журнал; in-проверки — из памяти."""
+
+    def __init__(self, store: StateStore, name: str):
+        self.store = store
+        self.name = name
+        self.items = set(store.data.get(name, {}))
+
+    def __contains__(self, key) -> bool:
+        return key in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def add(self, key):
+        if key not in self.items:
+            self.items.add(key)
+            self.store.write("add", self.name, key)
+
+    def discard(self, key):
+        if key in self.items:
+            self.items.discard(key)
+            self.store.write("del", self.name, key)
+
+    def remove(self, key):
+        if key not in self.items:
+            raise KeyError(key)
+        self.discard(key)
+
+
+class PersistentDict:
+    """Словарь с записью изменений в журнал."""
+
+    def __init__(self, store: StateStore, name: str):
+        self.store = store
+        self.name = name
+        self.items = dict(store.data.get(name, {}))
+
+    def __contains__(self, key) -> bool:
+        return key in self.items
+
+    def __getitem__(self, key):
+        return self.items[key]
+
+    def get(self, key, default=None):
+        return self.items.get(key, default)
+
+    def __setitem__(self, key, value):
+        if self.items.get(key, object()) != value:
+            self.items[key] = value
+            self.store.write("set", self.name, key, value)
+
+    def pop(self, key, default=None):
+        if key in self.items:
+            self.store.write("del", self.name, key)
+        return self.items.pop(key, default)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+store = StateStore(STATE_FILE)
+
 # после успешной верификации и показа гайдa EGE-скриншота бот ждёт фото ЕГЭ
-pending_ege_screenshot: set[int] = set()
+pending_ege_screenshot = store.set("pending_ege_screenshot")
 
 # после того как бот отправил инструкцию по отзывам, ждём именно скрина площадки
-pending_external_screenshot: set[int] = set()
\ No newline at end of file
+pending_external_screenshot = store.set("pending_external_screenshot")
+
+# временный контейнер «ждут ID» после отправки контакта
+pending_id = store.set("pending_id")
+# окончательно верифицированные пользователи
+verified_ids = store.set("verified_ids")
+# Telegram-ID → платформенный ID
+user_student = store.dict("user_student")
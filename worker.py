@@ -1,217 +1,350 @@
 import asyncio
+import contextlib
+import functools
+import json
 import os
-import re
-import cv2
-import pytesseract
-import gspread
+import pathlib
+import signal
+import time
 
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from dotenv import load_dotenv
-from gspread.exceptions import WorksheetNotFound, SpreadsheetNotFound
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-# Импортим состояние из state.py
-from state import pending_external_screenshot
+from dotenv import load_dotenv
 
-# ─── 1. Загрузка конфигурации ────────────────────────────────
+# настройки OCR_* ocr.py читает при импорте — .env должен быть загружен до него
 load_dotenv()
-SPREADSHEET_ID = os.getenv("SPREADSHEET_ID") or ""
-if not SPREADSHEET_ID:
-    raise RuntimeError("❌ SPREADSHEET_ID не найден в .env")
-
-# ─── 2. Подключение к Google Sheets ─────────────────────────
-gc = gspread.service_account(
-    filename="google_key.json",
-    scopes=[
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ],
+
+# Воркер только распознаёт: к Google Sheets он не подключается, баллы в таблицу
+# пишет процесс приёма (см. confirm_scores в bot.py)
+from ocr import extract_scores_timed, image_phash, init_process
+from ocr_cache import OcrCache
+from jobqueue import JobQueue
+from remote_queue import RemoteJobQueue
+from sender import Outbox, HIGH, make_bot
+import metrics
+
+# ─── 1. Пул OCR-процессов ─────────────────────────────────────
+# OCR_WORKERS — сколько скринов распознаём параллельно (по умолчанию = числу ядер),
+# OCR_TIMEOUT — сколько секунд ждём распознавания одного скрина.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS") or os.cpu_count() or 1)
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT") or 60)
+
+
+class OcrPool:
+    """ProcessPoolExecutor, который пересоздаётся, если дочерний процесс упал или завис."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = self._spawn()
+
+    def _spawn(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_process)
+
+    async def run(self, fn, *args, timeout: float | None = None):
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(executor, fn, *args), timeout)
+        except asyncio.TimeoutError:
+            # Просто бросить future мало: зависший Tesseract так и занимает слот,
+            # а следующие задачи копятся за ним и тоже ловят таймаут.
+            if executor is self.executor:
+                self.recycle()
+            raise
+        except BrokenProcessPool:
+            # процесс убит (OOM, segfault в cv2) — поднимаем пул заново
+            if executor is self.executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._spawn()
+            raise
+
+    def recycle(self):
+        """
+        Убивает процессы пула и поднимает новый. Остальные задачи старого пула
+        получат BrokenProcessPool и вернутся в очередь на повтор.
+        """
+        print("⚠️ OCR-процесс завис — пересоздаю пул")
+        old = self.executor
+        self.executor = self._spawn()
+        for proc in list((old._processes or {}).values()):
+            proc.terminate()
+        old.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        # не ждём зависшие процессы: executor сам дождётся их в atexit
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ─── 2. Кэш результатов OCR ───────────────────────────────────
+# Повторно присланный (или пересланный) скрин не распознаём заново.
+# OCR_CACHE_FILE — сохранять кэш между рестартами (пусто — только в памяти).
+ocr_cache = OcrCache(
+    max_items=int(os.getenv("OCR_CACHE_SIZE") or 2000),
+    ttl=float(os.getenv("OCR_CACHE_TTL") or 86400),
+    max_distance=int(os.getenv("OCR_CACHE_DISTANCE") or 4),
+    path=os.getenv("OCR_CACHE_FILE") or None,
 )
-try:
-    ss = gc.open_by_key(SPREADSHEET_ID)
-except SpreadsheetNotFound:
-    raise RuntimeError("❌ Таблица не найдена или нет доступа.")
-
-# ─── 3. Основная таблица баллов (EGE) ────────────────────────
-try:
-    sheet = ss.worksheet("EGE")
-except WorksheetNotFound:
-    sheet = ss.add_worksheet("EGE", rows=200, cols=30)
-    # Заголовки предметов должны быть добавлены администратором вручную.
-
-# ─── 4. Лист с отзывами ───────────────────────────────────────
-try:
-    feedback_sheet = ss.worksheet("Feedback")
-except WorksheetNotFound:
-    feedback_sheet = ss.add_worksheet("Feedback", rows=100, cols=3)
-    feedback_sheet.append_row(["tg_id", "feedback_type", "content"])
-
-# ─── 5. Конфигурация Tesseract (для Windows) ─────────────────
-TESS_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-if os.path.exists(TESS_PATH):
-    pytesseract.pytesseract.tesseract_cmd = TESS_PATH
-
-# ─── 6. Регулярка и словарь предметов ─────────────────────────
-PAIR_RE = re.compile(r"([А-ЯЁа-яё() ]+)[\s\n]+(\d{1,3})")
-ALIASES = {
-    "математика профильная": "math",
-    "математика профиль":    "math",
-    "физика":                "phys",
-    "русский язык":          "rus",
-    "информатика":           "inf",
-    "информатика кегэ":      "inf",
-    "информатика (кегэ)":    "inf",
-}
-
-
-def extract_scores(path: str) -> dict[str, int]:
-    """Оцифровывает картинку, извлекает пары «предмет — балл»."""
-    img = cv2.imread(path)
-
-    # 1) upscale ×3
-    img = cv2.resize(img, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)
-
-    # 2) CLAHE контраст
-    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-    cl = clahe.apply(l)
-    img = cv2.merge((cl, a, b))
-
-    # 3) в серый + Otsu threshold
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    _, thr = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-    # 4) OCR (oem 3 = LSTM, psm 6 = блок текста)
-    cfg = "--oem 3 --psm 6"
-    text = pytesseract.image_to_string(thr, lang="rus", config="--oem 3 --psm 6")
-    print("RAW OCR:\n", text)
-
-    result: dict[str, int] = {}
-    for subj_raw, val in PAIR_RE.findall(text):
-        subj = re.sub(r"[()]", "", subj_raw).strip().lower()
-        for alias, code in ALIASES.items():
-            if alias in subj:
-                result[code] = int(val)
-                break
-    return result
-
-
-def matches_sheet(tg_id: int, scores: dict[str, int], student_id: str) -> bool:
+
+
+# ─── 3. Очереди и исходящие сообщения ───────────────────────
+# Задачи OCR и события от воркеров к приёму живут в одном SQLite-файле JOB_DB.
+# JOB_QUEUE_MAX — сколько скринов максимум ждут обработки, дальше просим прислать позже.
+JOB_DB = os.getenv("JOB_DB") or "jobs.sqlite3"
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS") or 3)
+# сколько хранить задачи, исчерпавшие попытки (для разбора по last_error)
+JOB_DEAD_RETENTION_SEC = float(os.getenv("JOB_DEAD_RETENTION_SEC") or 7 * 86400)
+# Воркер на другой машине берёт задачи по HTTP у процесса приёма (см. README)
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL") or ""
+QUEUE_TOKEN = os.getenv("QUEUE_TOKEN") or ""
+# События, которые приём не смог применить (Sheets недоступен), повторяются
+# с нарастающей паузой от EVENTS_RETRY_SEC; после EVENTS_MAX_ATTEMPTS — в dead.
+EVENTS_RETRY_SEC = float(os.getenv("EVENTS_RETRY_SEC") or 15)
+EVENTS_MAX_ATTEMPTS = int(os.getenv("EVENTS_MAX_ATTEMPTS") or 8)
+
+
+def local_queues() -> tuple[JobQueue, JobQueue]:
+    """(задачи OCR, события для приёма) из локального JOB_DB."""
+    jobs = JobQueue(
+        JOB_DB,
+        "ocr",
+        max_depth=int(os.getenv("JOB_QUEUE_MAX") or 500),
+        visibility_timeout=float(os.getenv("JOB_VISIBILITY_SEC") or 300),
+        max_attempts=JOB_MAX_ATTEMPTS,
+        dead_retention=JOB_DEAD_RETENTION_SEC,
+    )
+    events = JobQueue(JOB_DB, "events", max_depth=100_000, max_attempts=EVENTS_MAX_ATTEMPTS,
+                      dead_retention=JOB_DEAD_RETENTION_SEC)
+    return jobs, events
+
+
+def make_outbox(bot) -> Outbox:
+    # лимиты Telegram: OUTBOX_GLOBAL_RATE на бота, OUTBOX_CHAT_RATE на чат (сообщений/с).
+    # Лимит на бота общий для всех процессов с этим токеном, а корзины у каждого
+    # свои — поэтому делим его на OUTBOX_PROCESSES (приём + все воркеры).
+    processes = max(int(os.getenv("OUTBOX_PROCESSES") or 1), 1)
+    return Outbox(
+        bot,
+        global_rate=float(os.getenv("OUTBOX_GLOBAL_RATE") or 25) / processes,
+        chat_rate=float(os.getenv("OUTBOX_CHAT_RATE") or 1),
+    )
+
+
+async def recognize(pool: OcrPool, task: dict, timings: dict[str, float]) -> dict[str, int]:
+    """Баллы со скрина: из кэша, если такой скрин уже видели, иначе — через OCR-пул."""
+    # скрин приходит либо байтами (SCREEN_STORAGE=memory), либо путём к файлу
+    if "data" in task:
+        data = task["data"]
+    else:
+        data = await asyncio.to_thread(pathlib.Path(task["file"]).read_bytes)
+
+    key = OcrCache.content_key(data)
+    scores = ocr_cache.get(key)
+    if scores is not None:
+        metrics.CACHE_LOOKUPS.inc(result="exact")
+        return scores
+
+    # cv2 отпускает GIL, так что хэш в потоке не тормозит event loop
+    phash = await asyncio.to_thread(image_phash, data)
+    scores = ocr_cache.get_near(phash, task["tg_id"])
+    if scores is not None:
+        metrics.CACHE_LOOKUPS.inc(result="near")
+    else:
+        metrics.CACHE_LOOKUPS.inc(result="miss")
+        # по таймауту зависший процесс убивается вместе с пулом (см. OcrPool.recycle)
+        scores, ocr_timings = await pool.run(extract_scores_timed, data, timeout=OCR_TIMEOUT)
+        metrics.OCR_PASSES.inc(ocr_timings.pop("passes", 0))
+        timings.update(ocr_timings)
+    ocr_cache.put(key, phash, task["tg_id"], scores)
+    return scores
+
+
+def log_task(task: dict, result: str, timings: dict[str, float]):
+    """Структурный лог одной задачи: стадии в мс, одной JSON-строкой."""
+    for stage, sec in timings.items():
+        metrics.STAGE_SECONDS.observe(sec, stage=stage)
+    metrics.TASKS.inc(result=result)
+    print(json.dumps({
+        "event": "ocr_task",
+        "tg_id": task["tg_id"],
+        "result": result,
+        **{f"{stage}_ms": round(sec * 1000, 1) for stage, sec in timings.items()},
+    }, ensure_ascii=False))
+
+
+async def handle_task(outbox: Outbox, pool: OcrPool, task: dict, events: JobQueue):
+    tg_id      = task["tg_id"]
+    student_id = task.get("student_id", "")
+    started = time.perf_counter()
+    # download замеряет bot.py, время в очереди — разница с моментом постановки
+    timings: dict[str, float] = dict(task.get("timings", {}))
+    if "enqueued_at" in task:
+        timings["queue_wait"] = max(time.time() - task["enqueued_at"], 0.0)
+    result = "error"
+
+    try:
+        # 1) OCR — в отдельном процессе, чтобы не блокировать event loop
+        try:
+            scores = await recognize(pool, task, timings)
+        except asyncio.TimeoutError:
+            result = "timeout"
+            await outbox.send_message(tg_id, "⚠️ Распознавание заняло слишком много времени, пришлите скрин ещё раз.",
+                                      priority=HIGH)
+            return
+
+        # 2) Результат распознавания, запись в таблицу и ответ про отзыв — в процессе
+        # приёма: воркеров может быть несколько, а строку ученика и состояние отзыва
+        # должен вести один; там же одна очередь сообщений на чат, и «Распознано»
+        # не обгонит подтверждение и склеится с ним
+        try:
+            await events.put({"event": "scores", "tg_id": tg_id, "student_id": student_id, "scores": scores})
+        except Exception:
+            # приём недоступен или очередь занята — без события баллы потеряются;
+            # задача уйдёт на повтор (OCR второй раз не нужен: результат в кэше)
+            result = "retry"
+            raise
+        result = "ok"
+
+
+    except BrokenProcessPool:
+        # упал OCR-процесс — задача уйдёт на повтор через очередь
+        result = "retry"
+        raise
+
+    except Exception as exc:
+        if result == "retry":
+            raise
+        await outbox.send_message(tg_id, f"⚠️ Ошибка проверки: {exc}", priority=HIGH)
+
+
+    finally:
+
+        if result != "retry" and "file" in task and os.path.exists(task["file"]):
+            os.remove(task["file"])
+        timings["total"] = time.perf_counter() - started
+        log_task(task, result, timings)
+
+
+FAILED_TEXT = "⚠️ Не удалось обработать скрин, пришлите его ещё раз."
+_notifications: set[asyncio.Task] = set()
+
+
+def dead_job_handler(send):
     """
-    Сверяет/дописывает баллы в таблицу EGE:
-    - Если пользователя нет — добавляет новую строку.
-    - Иначе обновляет отличающиеся баллы.
-    Всегда возвращает True (считаем проверку пройденной).
+    on_dead для очереди OCR: задача исчерпала попытки (упала или зависла) —
+    говорим пользователю прислать скрин заново и удаляем временный файл.
     """
-    header = sheet.row_values(1)
-    # Найдём индекс колонки student_id (должен быть 2)
-    try:
-        idx_sid = header.index("student_id")  # 0-based
-    except ValueError:
-        idx_sid = None
-
-    cell = sheet.find(str(tg_id))
-    if cell is None:
-        new_row = [""] * len(header)
-        new_row[0] = str(tg_id)
-        if idx_sid is not None:
-            new_row[idx_sid] = student_id
-        for subj, val in scores.items():
-            if subj in header:
-                new_row[header.index(subj)] = str(val)
-        sheet.append_row(new_row)
-        return True
-
-    # Если уже есть строка — при необходимости пишем student_id и обновляем баллы
-    row_idx = cell.row
-    if idx_sid is not None:
-        existing = sheet.cell(row_idx, idx_sid + 1).value  # +1, потому что API 1-based
-        if not existing:
-            sheet.update_cell(row_idx, idx_sid + 1, student_id)
-
-    for subj, val in scores.items():
-        if subj in header:
-            col = header.index(subj) + 1
-            sheet.update_cell(row_idx, col, str(val))
-    return True
-
-
-async def run_worker(bot, q: asyncio.Queue):
+    def on_dead(task: dict):
+        if "file" in task and os.path.exists(task["file"]):
+            os.remove(task["file"])
+
+        async def notify():
+            try:
+                await send(task["tg_id"], FAILED_TEXT)
+            except Exception as exc:
+                print(f"⚠️ Не удалось сообщить {task['tg_id']} об ошибке: {exc}")
+
+        job = asyncio.get_running_loop().create_task(notify())
+        _notifications.add(job)
+        job.add_done_callback(_notifications.discard)
+    return on_dead
+
+
+def _settle(q: JobQueue, job_id: int, job: asyncio.Task):
+    """ack / nack задачи по итогу handle_task."""
+    if job.cancelled():
+        return  # не доделали до остановки — задача вернётся после visibility timeout
+    exc = job.exception()
+    if exc is None:
+        q.ack(job_id)
+        return
+    # после max_attempts очередь сама вызовет on_dead: ответ пользователю и удаление файла
+    q.nack(job_id, repr(exc))
+
+
+async def _consume(outbox: Outbox, q: JobQueue, events: JobQueue, pool: OcrPool, inflight: set):
     while True:
-        task = await q.get()
-        tg_id      = task["tg_id"]
-        student_id = task.get("student_id", "")
-
+        job_id, task = await q.get()
+        job = asyncio.create_task(handle_task(outbox, pool, task, events))
+        inflight.add(job)
+        job.add_done_callback(inflight.discard)
+        job.add_done_callback(functools.partial(_settle, q, job_id))
+        # shield: при остановке бота начатая задача дорабатывает до конца
         try:
-            # 1) OCR
-            scores = extract_scores(task["file"])
-            await bot.send_message(tg_id, f"🔍 Распознано: {scores}")
-
-            # 2) Запись баллов
-            ok = matches_sheet(tg_id, scores, student_id)
-            result_msg = "✅ Баллы подтверждены!" if ok else "⚠️ Не совпало, куратор проверит вручную."
-            await bot.send_message(tg_id, result_msg)
-
-            if ok:
-                # сразу предлагаем кнопки "Редактировать баллы" и "Редактировать отзыв"
-                kb = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="✏️ Редактировать баллы", callback_data="edit_scores")],
-                    [InlineKeyboardButton(text="✏️ Редактировать отзыв", callback_data="edit_review")],
-                ])
-                await bot.send_message(tg_id, "Если нужно что-то поменять, выберите опцию:", reply_markup=kb)
-
-            # 3) Инструкция по отзыву на внешних площадках
-            if ok:
-                fcell = feedback_sheet.find(str(tg_id))
-                if fcell is None:
-                    await bot.send_message(
-                        tg_id,
-                        "🟢ТЗ К ОТЗЫВАМ НА ВП (внешние площадки) 🟢\n\n"
-                        "Почему ты выбрала «99 баллов»?\n"
-                        "Поделись своими впечатлениями об уроках, конспектах, домашних заданиях. Может, запомнились какие-то лайфхаки или что-то на уроках оказалось для тебя наиболее ценным и эффективным?\n"
-                        "Расскажи, в чем улучшились твои знания во время обучения в «99 баллов» и какой результат ты получила.\n"
-                        "Кому бы ты порекомендовала нашу школу и почему?\n\n"
-                        "👆 Если оставишь отзыв на ВП, то пришли скрин\n\n"
-                        "Озывы ты можешь оставить на одной из этих площадок:\n"
-                        "- ОТЗОВИК (в поисковике набери «отзовик 99 баллов»)\n"
-                        "- Яндекс: https://yandex.ru/maps/org/99_ballov/59607351472/?ll=49.143410%2C55.787270&z=13.85\n"
-                        "- Сравни: https://www.sravni.ru/shkola/99-ballov/otzyvy/\n"
-                        "- 2ГИС: https://2gis.ru/kazan/firm/70000001044938528\n\n"
-                        "Отзыв можно оставить в нескольких местах.\n\n"
-                        "Если не хочешь оставлять отзыв, отправь просто «-».\n\n"
-                        "📹 Видео-отзыв:\n"
-                        "1. Держите телефон горизонтально.\n"
-                        "2. Проверьте качество звука — без громких шумов.\n\n"
-                        "Что рассказать:\n"
-                        "- Ваше имя;\n"
-                        "- Из какого города вы;\n"
-                        "- На каком предмете(ах) и в каком году вы занимались;\n"
-                        "- Сколько баллов вы написали на экзамене;\n"
-                        "- Почему вы выбрали «99 баллов»;\n"
-                        "- Ваши впечатления об уроках, конспектах и домашних заданиях;\n"
-                        "- Какие лайфхаки вы вынесли;\n"
-                        "- В чём улучшились ваши знания;\n"
-                        "- Кому бы вы порекомендовали нашу школу и почему;\n"
-                        "- Небольшое заключение и напутствие.\n"
-                        "Обратная связь: @diwan1337",
-                    )
-                    # теперь мы ждём от этого пользователя именно скриншот площадки
-                    await bot.send_message(tg_id,
-                                           "🙏 Спасибо за баллы! Теперь, пожалуйста, оставьте отзыв на внешней площадке…")
-                    pending_external_screenshot.add(tg_id)
-                else:
-                    await bot.send_message(
-                        tg_id,
-                        "🙂 Ваш отзыв уже сохранён. Чтобы обновить, отправьте новый текст или видео или скриншот площадки."
-                    )
-
-
-        except Exception as exc:
-
-            await bot.send_message(tg_id, f"⚠️ Ошибка проверки: {exc}")
-
-
-        finally:
-
-            if os.path.exists(task["file"]):
-                os.remove(task["file"])
+            await asyncio.shield(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass  # уже учтено в _settle
+
+
+async def run_worker(outbox: Outbox, q: JobQueue, events: JobQueue, workers: int = OCR_WORKERS,
+                     recover: bool = True):
+    """
+    Запускает `workers` параллельных потребителей очереди поверх общего OCR-пула.
+    recover=True — только если этот процесс единственный разбирает очередь.
+    """
+    if recover:
+        recovered = await asyncio.to_thread(q.recover)
+        if recovered:
+            print(f"♻️ Возобновлено незавершённых задач: {recovered}")
+    q.on_dead = dead_job_handler(functools.partial(outbox.send_message, priority=HIGH))
+    pool = OcrPool(workers)
+    inflight: set[asyncio.Task] = set()
+    metrics.QUEUE_DEPTH.fn = q.qsize
+    metrics.INFLIGHT.fn = lambda: len(inflight)
+    consumers = [asyncio.create_task(_consume(outbox, q, events, pool, inflight)) for _ in range(workers)]
+    try:
+        await asyncio.gather(*consumers)
+    finally:
+        # Мягкая остановка: новых задач не берём, начатые ждём не дольше OCR_TIMEOUT
+        for c in consumers:
+            c.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        if inflight:
+            await asyncio.wait(inflight, timeout=OCR_TIMEOUT)
+        pool.shutdown()
+        ocr_cache.save()
+        print(f"OCR cache: {ocr_cache.stats()}")
+
+
+# ─── 4. Отдельный процесс-воркер ─────────────────────────────
+async def main():
+    """
+    Только OCR: `python worker.py`. Берёт задачи из общего JOB_DB
+    (или у процесса приёма по JOB_QUEUE_URL) и сам отвечает пользователям;
+    баллы в таблицу пишет уже процесс приёма (событие "scores").
+    Таких процессов может быть несколько — на одной машине и на разных.
+    """
+    # SIGTERM (docker stop, systemd) — та же мягкая остановка, что и Ctrl+C
+    with contextlib.suppress(NotImplementedError):  # Windows
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    if JOB_QUEUE_URL:
+        q = RemoteJobQueue(JOB_QUEUE_URL, QUEUE_TOKEN, "ocr", max_attempts=JOB_MAX_ATTEMPTS)
+        events = RemoteJobQueue(JOB_QUEUE_URL, QUEUE_TOKEN, "events")
+    else:
+        q, events = local_queues()
+    bot = make_bot(os.getenv("BOT_TOKEN") or "")
+    outbox = make_outbox(bot)
+    metrics_runner = None
+    if os.getenv("METRICS_PORT"):
+        metrics_runner = await metrics.serve(int(os.getenv("METRICS_PORT")), os.getenv("METRICS_HOST") or "127.0.0.1")
+    metrics.OUTBOX_PENDING.fn = outbox.pending
+    sender = asyncio.create_task(outbox.run())
+    try:
+        # соседние воркеры могут прямо сейчас обрабатывать задачи — recover не делаем
+        await run_worker(outbox, q, events, recover=False)
+    finally:
+        await outbox.close()
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        await q.close()
+        await events.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(main())